@@ -0,0 +1,94 @@
+# Compares two benchmark results of benchmarks/run.py, stage by stage
+# A stage regresses when its best time grew by more than the threshold,
+# ignoring stages too short to time reliably.
+import argparse
+import json
+import sys
+from typing import Dict, List, NamedTuple
+
+THRESHOLD = 0.10
+MIN_SECONDS = 0.5
+# results are only comparable on the same corpus with as many workers
+SETTINGS = ("scale", "seed", "jobs")
+
+
+class Change(NamedTuple):
+    """Best times of a stage in two results
+    """
+    stage: str
+    before: float
+    after: float
+    regression: bool
+
+    @property
+    def ratio(self) -> float:
+        return self.after / self.before if self.before > 0 else float("inf")
+
+
+def load_results(path: str) -> Dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = THRESHOLD,
+            min_seconds: float = MIN_SECONDS) -> List[Change]:
+    """Changes of the stages timed in both results
+
+    Args:
+        baseline (Dict): Earlier results
+        current (Dict): Later results, of the same settings
+        threshold (float, optional): Slowdown flagged, as a fraction of the baseline. Defaults to 0.10.
+        min_seconds (float, optional): Stages faster than this in both results are never flagged.
+            Defaults to 0.5.
+
+    Raises:
+        ValueError: When the results are not of the same settings
+
+    Returns:
+        List[Change]: Changes, in the order of the current results
+    """
+    for key in SETTINGS:
+        if baseline.get(key) != current.get(key):
+            raise ValueError("Results of different settings: {} {} and {}".format(
+                key, baseline.get(key), current.get(key)))
+    changes = []
+    for stage, timing in current["stages"].items():
+        if stage not in baseline["stages"]:
+            continue
+        before, after = baseline["stages"][stage]["seconds"], timing["seconds"]
+        regression = after > before * (1 + threshold) and max(before, after) >= min_seconds
+        changes.append(Change(stage, before, after, regression))
+    return changes
+
+
+def print_changes(changes: List[Change], file=sys.stdout):
+    print("{:<12} {:>10} {:>10} {:>8}".format("stage", "before", "after", "ratio"), file=file)
+    for change in changes:
+        print("{:<12} {:>10.3f} {:>10.3f} {:>8.2f}{}".format(
+            change.stage, change.before, change.after, change.ratio,
+            "  REGRESSION" if change.regression else ""), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares two benchmark results, flagging the stages "
+                                     "that got slower")
+
+    parser.add_argument("baseline", help="Earlier results of benchmarks/run.py")
+    parser.add_argument("current", help="Later results of benchmarks/run.py")
+    parser.add_argument("--threshold", help="Slowdown flagged, as a fraction (default: %(default)s)",
+                        type=float, default=THRESHOLD)
+    parser.add_argument("--min-seconds", help="Never flag stages faster than this (default: %(default)s)",
+                        type=float, default=MIN_SECONDS)
+
+    args = parser.parse_args()
+    try:
+        changes = compare(load_results(args.baseline), load_results(args.current), args.threshold,
+                          args.min_seconds)
+    except ValueError as error:
+        parser.error(str(error))
+    print_changes(changes)
+    if any(change.regression for change in changes):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# Times each stage of the pipeline on a synthetic corpus (see synthetic.py)
+#   load         loader.load_corpus of the training corpus
+#   blog_stream  Preprocessor.blog_stream over the training corpus
+#   tokenize     FastTweetTokenizer over every blog
+#   fit          fitting the TF-IDF vectorizer, as vectorizer.py does
+#   transform    transforming the training corpus, as train.py does
+#   train        fitting the classifier of each label
+#   predict      transforming the test set and predicting each label, as predict.py does
+#   quiz         quiz.py on the quiz file
+#   count_type   corpus/count_type.py on the training corpus
+# quiz and count_type run as scripts, interpreter start included.
+# Each stage runs --repeat times and keeps its best time. The results go to a
+# json file, compared to an earlier one with --compare (see compare.py).
+# Run from the root of the repository:
+#   python -m benchmarks.run --scale small --compare data/benchmarks/results/small-baseline.json
+import argparse
+import json
+import os
+import platform
+from pickle import dump, load
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+import warnings
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from benchmarks.synthetic import SCALES, generate
+from benchmarks.compare import MIN_SECONDS, SETTINGS, THRESHOLD, compare, load_results, print_changes
+from loader import csv_files, load_corpus
+import parallel
+from train import make_classifier
+from corpus.preprocessing import Preprocessor
+from corpus.tokenizer import FastTweetTokenizer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("load", "blog_stream", "tokenize", "fit", "transform", "train", "predict", "quiz", "count_type")
+LABELS = ("gender", "age", "zodiac")
+# file names of learn.sh, so that quiz.py finds them in the workspace
+VECTORIZER = "tfidf"
+MODEL = "logistic_C20"
+RESULTS_VERSION = 1
+
+
+class Benchmark():
+    """Times the stages of the pipeline on the files of a workspace
+    """
+
+    def __init__(self, workspace: str, repeat: int, jobs: int, stages: List[str]):
+        """
+        Args:
+            workspace (str): Directory of the synthetic corpus and of the files written by the stages
+            repeat (int): Runs of each stage
+            jobs (int): Worker processes of the stages that have some
+            stages (List[str]): Stages to time, the others run once when later stages need them
+        """
+        self.workspace = workspace
+        self.repeat = repeat
+        self.jobs = jobs
+        self.stages = stages
+        self.results: Dict[str, Dict] = {}
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.workspace, *parts)
+
+    def timed(self, name: str, function: Callable[[Any], Any], count: Callable[[Any], int],
+              setup: Callable[[], Any] = lambda: None) -> Any:
+        """Runs a stage, timing each run if it is one of the stages to time
+
+        Args:
+            name (str): Stage name
+            function (Callable): The stage, given the result of setup
+            count (Callable): Number of items processed, from the result of the stage
+            setup (Callable, optional): Untimed preparation before each run
+
+        Returns:
+            Any: Result of the last run
+        """
+        if name not in self.stages:
+            return function(setup())
+        seconds = []
+        for _ in range(self.repeat):
+            prepared = setup()
+            start = time.perf_counter()
+            result = function(prepared)
+            seconds.append(time.perf_counter() - start)
+        items = count(result)
+        self.results[name] = {"seconds": min(seconds), "median": statistics.median(seconds),
+                              "runs": seconds, "items": items, "per_second": items / max(min(seconds), 1e-9)}
+        print("{:<12} {:>9.3f}s {:>12.1f} items/s".format(name, min(seconds), self.results[name]["per_second"]),
+              file=sys.stderr)
+        return result
+
+    def script(self, name: str, arguments: List[str], items: int):
+        """Times a script of the repository, run in the workspace
+        """
+        if name not in self.stages:
+            return
+        command = [sys.executable, os.path.join(ROOT, arguments[0])] + arguments[1:]
+        self.timed(name, lambda _: subprocess.run(command, cwd=self.workspace, stdout=subprocess.DEVNULL,
+                                                  check=True),
+                   lambda _: items)
+
+    def load_vectorizer(self) -> TfidfVectorizer:
+        with open(self.path("data", "vectorizers", VECTORIZER + ".vec"), "rb") as file:
+            return load(file)
+
+    def run(self, paths: Dict[str, str]):
+        train, test, quiz = paths["train"], paths["test"], paths["quiz"]
+        os.makedirs(self.path("data", "vectorizers"), exist_ok=True)
+        os.makedirs(self.path("data", "models"), exist_ok=True)
+
+        corpus = self.timed("load", lambda _: load_corpus(train, verbose=False), len)
+        blogs = corpus["blog"]
+        self.timed("blog_stream", lambda _: sum(1 for _ in Preprocessor(train).blog_stream()), lambda count: count)
+        # a new tokenizer each run, so that its memo starts empty
+        self.timed("tokenize", lambda tokenizer: [tokenizer.tokenize(blog) for blog in blogs],
+                   len, setup=FastTweetTokenizer)
+
+        vectorizer = self.timed(
+            "fit", lambda tokenizer: parallel.fit(TfidfVectorizer(tokenizer=tokenizer.tokenize, lowercase=False),
+                                                  blogs, self.jobs),
+            lambda _: len(blogs), setup=FastTweetTokenizer)
+        with open(self.path("data", "vectorizers", VECTORIZER + ".vec"), "wb") as file:
+            dump(vectorizer, file)
+
+        # the saved vectorizer, as train.py and predict.py load it
+        X_train = self.timed("transform", lambda vectorizer: parallel.transform(vectorizer, blogs, self.jobs),
+                             lambda X: X.shape[0], setup=self.load_vectorizer)
+
+        def fit_all(_) -> Dict:
+            models = {}
+            for label in LABELS:
+                models[label] = make_classifier().fit(X_train, np.asarray(corpus[label]))
+            return models
+        models = self.timed("train", fit_all, lambda _: len(blogs))
+        for label, model in models.items():
+            with open(self.path("data", "models", f"{label}-{MODEL}-{VECTORIZER}.model"), "wb") as file:
+                dump(model, file)
+
+        test_blogs = load_corpus(test, columns=["blog"], verbose=False)["blog"]
+        def predict_all(vectorizer) -> np.ndarray:
+            X_test = parallel.transform(vectorizer, test_blogs, self.jobs)
+            return np.stack([models[label].predict(X_test) for label in LABELS])
+        self.timed("predict", predict_all, lambda _: len(test_blogs), setup=self.load_vectorizer)
+
+        quiz_blogs = len(pd.read_csv(quiz, names=["bloggerID", "blog"], usecols=["bloggerID"]))
+        self.script("quiz", ["quiz.py", os.path.abspath(quiz), MODEL, VECTORIZER,
+                             os.path.join("data", "quiz-predictions.csv")], quiz_blogs)
+        self.script("count_type", [os.path.join("corpus", "count_type.py"), os.path.abspath(train),
+                                   "--jobs", str(self.jobs)], len(csv_files(train)))
+
+
+def commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Times each stage of the pipeline on a synthetic corpus "
+                                     "and saves the results as json")
+
+    parser.add_argument("--scale", help="Size of the synthetic corpus (default: %(default)s)", choices=SCALES,
+                        default="small")
+    parser.add_argument("--seed", help="Seed of the synthetic corpus (default: %(default)s)", type=int, default=0)
+    parser.add_argument("--stage", help="Stages to time (default: all)", nargs='+', choices=STAGES,
+                        default=list(STAGES))
+    parser.add_argument("--repeat", help="Runs of each stage, the best is kept (default: %(default)s)",
+                        type=int, default=3)
+    parser.add_argument("--jobs", help="Worker processes of fit, transform, predict and count_type "
+                        "(default: %(default)s)", type=int, default=1)
+    parser.add_argument("--workspace", help="Directory of the corpus and of the files of the stages "
+                        "(default: data/benchmarks/SCALE-SEED)")
+    parser.add_argument("--output", help="Results file (default: data/benchmarks/results/SCALE-TIME.json)")
+
+    parser.add_argument("--compare", metavar="baseline", help="Earlier results to compare with, "
+                        "exits with 1 when a stage got slower")
+    parser.add_argument("--threshold", help="Slowdown flagged by --compare, as a fraction (default: %(default)s)",
+                        type=float, default=THRESHOLD)
+    parser.add_argument("--min-seconds", help="Stages faster than this are never flagged (default: %(default)s)",
+                        type=float, default=MIN_SECONDS)
+
+    args = parser.parse_args()
+    if args.compare is not None:
+        # known before spending the time of the run
+        baseline = load_results(args.compare)
+        for key in SETTINGS:
+            if baseline.get(key) != getattr(args, key):
+                parser.error("{} was run with {} {}".format(args.compare, key, baseline.get(key)))
+    return args
+
+def main():
+    args = get_args()
+    workspace = args.workspace or os.path.join("data", "benchmarks", f"{args.scale}-{args.seed}")
+    started = time.strftime("%Y%m%d-%H%M%S")
+    output = args.output or os.path.join("data", "benchmarks", "results", f"{args.scale}-{started}.json")
+    baseline = load_results(args.compare) if args.compare is not None else None
+
+    start = time.perf_counter()
+    paths = generate(workspace, args.scale, args.seed)
+    print("Corpus ready in {:.1f}s".format(time.perf_counter() - start), file=sys.stderr)
+
+    benchmark = Benchmark(workspace, args.repeat, args.jobs, args.stage)
+    # the synthetic labels are not meant to converge
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        benchmark.run(paths)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "scale": args.scale,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "jobs": args.jobs,
+        "started": started,
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "libraries": {"numpy": np.__version__, "pandas": pd.__version__, "scikit-learn": sklearn.__version__},
+        "corpus": {"files": len(csv_files(paths["train"])),
+                   "bytes": sum(os.path.getsize(path) for path in csv_files(paths["train"]))},
+        "stages": benchmark.results,
+    }
+    folder, _ = os.path.split(output)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=1)
+    print("Results saved to {}".format(output), file=sys.stderr)
+
+    if baseline is not None:
+        changes = compare(baseline, results, args.threshold, args.min_seconds)
+        print_changes(changes)
+        if any(change.regression for change in changes):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
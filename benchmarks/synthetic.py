@@ -0,0 +1,184 @@
+# Synthetic blog corpus, laid out as the real one
+# Every blogger gets a {ID}.{gender}.{age}.{zodiac}.csv file of headerless rows
+#   ID,gender,age,zodiac,blog
+# and the quiz file gets rows of ID,blog. Words follow a Zipf law over a
+# made-up vocabulary, sprinkled with what the tweet tokenizer cares about
+# (emoticons, urls, handles, hashtags, numbers, accents, elongations, html
+# entities), and each label value favours a few marker words so that the
+# classifiers have something to learn. The same scale and seed always give
+# the same files.
+import argparse
+import json
+import os
+from typing import Dict, List, NamedTuple
+import numpy as np
+import pandas as pd
+
+GENDERS = ("male", "female")
+# ages of the blog authorship corpus, by age category
+AGES = (tuple(range(13, 18)), tuple(range(23, 28)), tuple(range(33, 49)))
+ZODIACS = ("Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio",
+           "Sagittarius", "Capricorn", "Aquarius", "Pisces")
+
+SYLLABLES = ("ba", "ke", "lo", "mi", "nu", "ra", "se", "ti", "vo", "za", "che", "dra",
+             "fen", "gli", "hor", "jas", "kin", "mor", "pla", "que", "str", "tha", "wen", "yul")
+SPECIAL = (":)", ":-D", ";)", ":(", "<3", "LOL!!!", "soooo", "&amp;", "&quot;", "café", "naïve",
+           "www.example.com", "http://example.com/post?id=42", "@user", "#tag", "42", "1,000",
+           "3.14", "2004", "don't", "won't", "...", "!!!", "?!", "é")
+
+MANIFEST = "synthetic.json"
+
+
+class Scale(NamedTuple):
+    """Size of a synthetic corpus
+    """
+    bloggers: int
+    posts: int
+    words: int
+    vocabulary: int
+    test_bloggers: int
+    quiz: int
+
+
+# tiny is a smoke test, too short to flag regressions; full is about the size
+# of the real training corpus
+SCALES: Dict[str, Scale] = {
+    "tiny": Scale(bloggers=40, posts=10, words=60, vocabulary=5000, test_bloggers=10, quiz=200),
+    "small": Scale(bloggers=400, posts=25, words=120, vocabulary=50000, test_bloggers=100, quiz=2000),
+    "medium": Scale(bloggers=2000, posts=35, words=200, vocabulary=200000, test_bloggers=500, quiz=10000),
+    "full": Scale(bloggers=19320, posts=35, words=200, vocabulary=1000000, test_bloggers=2000, quiz=50000),
+}
+
+
+class Generator():
+    """Draws blogs of a scale, deterministically from a seed
+    """
+
+    def __init__(self, scale: Scale, seed: int = 0):
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+        self.words = self.make_words(scale.vocabulary)
+        # Zipf law, the most frequent word first
+        weights = 1.0 / np.arange(1, len(self.words) + 1)
+        self.cumulative = np.cumsum(weights / weights.sum())
+        # marker words of each label value, drawn from the rarer half
+        values = [("gender", value) for value in GENDERS] + [("age", value) for value in (0, 1, 2)] \
+            + [("zodiac", value) for value in ZODIACS]
+        markers = self.rng.choice(np.arange(len(self.words) // 2, len(self.words)), size=(len(values), 20),
+                                  replace=False)
+        self.markers = {value: self.words[indices].tolist() for value, indices in zip(values, markers)}
+        self.next_id = 1000000
+
+    def make_words(self, size: int) -> np.ndarray:
+        words = set()
+        while len(words) < size:
+            count = max(size - len(words), 1)
+            lengths = self.rng.integers(1, 5, count)
+            syllables = self.rng.integers(0, len(SYLLABLES), (count, 4))
+            words.update("".join(SYLLABLES[index] for index in row[:length])
+                         for row, length in zip(syllables, lengths))
+        # the set order depends on the hash seed
+        words = sorted(words)
+        self.rng.shuffle(words)
+        return np.array(words[:size], dtype=object)
+
+    def blog(self, markers: List[str]) -> str:
+        length = max(1, int(self.rng.poisson(self.scale.words)))
+        words = self.words[np.searchsorted(self.cumulative, self.rng.random(length))]
+        # about one word in twenty tells the labels
+        chosen = self.rng.random(length) < 0.05
+        words[chosen] = self.rng.choice(markers, int(chosen.sum()))
+        special = self.rng.random(length) < 0.03
+        words[special] = self.rng.choice(SPECIAL, int(special.sum()))
+        # some blogs start with a capital, some words are shouted
+        shouted = self.rng.random(length) < 0.01
+        words[shouted] = [word.upper() for word in words[shouted]]
+        if self.rng.random() < 0.5:
+            words[0] = words[0].capitalize()
+        return " ".join(words)
+
+    def blogger(self) -> pd.DataFrame:
+        gender = GENDERS[self.rng.integers(len(GENDERS))]
+        category = int(self.rng.integers(len(AGES)))
+        age = AGES[category][self.rng.integers(len(AGES[category]))]
+        zodiac = ZODIACS[self.rng.integers(len(ZODIACS))]
+        markers = self.markers[("gender", gender)] + self.markers[("age", category)] \
+            + self.markers[("zodiac", zodiac)]
+        posts = max(1, int(self.rng.poisson(self.scale.posts)))
+        self.next_id += int(self.rng.integers(1, 1000))
+        return pd.DataFrame({"ID": self.next_id, "Gender": gender, "Age": age, "Zodiac": zodiac,
+                             "Blog": [self.blog(markers) for _ in range(posts)]})
+
+    def write_corpus(self, directory: str, bloggers: int):
+        """Writes the csv files of some bloggers in a directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        for _ in range(bloggers):
+            dataframe = self.blogger()
+            dataframe.to_csv(os.path.join(directory, "{}.{}.{}.{}.csv".format(*dataframe.iloc[0, :4])),
+                             header=False, index=False)
+
+    def write_quiz(self, path: str, blogs: int):
+        """Writes a quiz file of ID,blog rows, with blogs of random bloggers
+        """
+        rows = []
+        while len(rows) < blogs:
+            dataframe = self.blogger()
+            rows.extend(zip(dataframe["ID"], dataframe["Blog"]))
+        pd.DataFrame(rows[:blogs]).to_csv(path, header=False, index=False)
+
+
+def generate(directory: str, scale: str, seed: int = 0) -> Dict[str, str]:
+    """Generates the train and test corpora and the quiz file of a scale, unless
+    the directory already has them for the same scale and seed
+
+    Args:
+        directory (str): Where to write train/, test/ and quiz.csv
+        scale (str): Name of the scale, see SCALES
+        seed (int, optional): Seed of the random draws. Defaults to 0.
+
+    Returns:
+        Dict[str, str]: Paths of the train and test directories and of the quiz file
+    """
+    paths = {"train": os.path.join(directory, "train"), "test": os.path.join(directory, "test"),
+             "quiz": os.path.join(directory, "quiz.csv")}
+    description = {"scale": scale, "seed": seed, **SCALES[scale]._asdict()}
+    manifest = os.path.join(directory, MANIFEST)
+    try:
+        with open(manifest) as file:
+            if json.load(file) == description:
+                return paths
+    except (OSError, ValueError):
+        pass
+
+    if os.path.exists(manifest):
+        os.remove(manifest)
+    generator = Generator(SCALES[scale], seed)
+    for path in (paths["train"], paths["test"]):
+        if os.path.isdir(path):
+            for file in os.listdir(path):
+                if file.endswith(".csv"):
+                    os.remove(os.path.join(path, file))
+    generator.write_corpus(paths["train"], SCALES[scale].bloggers)
+    generator.write_corpus(paths["test"], SCALES[scale].test_bloggers)
+    generator.write_quiz(paths["quiz"], SCALES[scale].quiz)
+    # written last, so that an interrupted generation starts over
+    with open(manifest, "w") as file:
+        json.dump(description, file, indent=1)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic blog corpus, test set and quiz file")
+
+    parser.add_argument("directory", help="Where to write train/, test/ and quiz.csv")
+    parser.add_argument("--scale", help="Size of the corpus (default: %(default)s)", choices=SCALES,
+                        default="small")
+    parser.add_argument("--seed", help="Seed of the random draws (default: %(default)s)", type=int, default=0)
+
+    args = parser.parse_args()
+    paths = generate(args.directory, args.scale, args.seed)
+    print("\n".join("{}: {}".format(name, path) for name, path in paths.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+# Compact format of a fitted TfidfVectorizer, quick to load
+# The pickle holds the vocabulary as a dict of millions of strings, rebuilt
+# object by object at every load. The compact format is a directory next to
+# the pickle, {vectorizer}.compact, with:
+#   terms.bin, offsets.npy   the terms in feature order (sorted), as one utf-8 string table
+#   hashes.npy, table.npy    an open addressing hash table from the crc32 of a term to its feature
+#   idf.npy                  the idf weights
+#   vectorizer.pkl           the vectorizer without its vocabulary, for the analyzer and settings
+#   config.json              format version and the number of features
+# Everything but the small pickle is memory-mapped, so loading costs next to nothing
+# and terms are looked up only when a document contains them.
+import argparse
+import copy
+import json
+import mmap
+import os
+from pickle import dump, load
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, List, Mapping
+import zlib
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfTransformer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+FORMAT_VERSION = 1
+CONFIG = "config.json"
+SHELL = "vectorizer.pkl"
+TERMS = "terms.bin"
+OFFSETS = "offsets.npy"
+HASHES = "hashes.npy"
+TABLE = "table.npy"
+IDF = "idf.npy"
+
+# looked up terms remembered by a loaded vectorizer, cleared when full
+CACHE_SIZE = 1 << 20
+
+
+def descending_idf_product() -> bool:
+    """Whether TfidfTransformer lists the features of a row in descending order,
+    as the product by a diagonal idf matrix of older scikit-learn does.
+    The order of the features changes the rounding of their norm.
+    """
+    transformer = TfidfTransformer(norm=None).fit(csr_matrix(np.ones((1, 2))))
+    return transformer.transform(csr_matrix(np.ones((1, 2)))).indices[0] == 1
+
+DESCENDING = descending_idf_product()
+
+
+def compact_path(path: str) -> str:
+    """Directory of the compact format of a pickled vectorizer
+    """
+    return path + ".compact"
+
+
+def export_vectorizer(vectorizer: TfidfVectorizer, directory: str):
+    """Saves a fitted TfidfVectorizer in the compact format
+
+    Args:
+        vectorizer (TfidfVectorizer): Fitted vectorizer
+        directory (str): Folder to create or replace
+    """
+    if not isinstance(vectorizer, TfidfVectorizer):
+        raise TypeError("Only a TfidfVectorizer has a compact format, not {}".format(type(vectorizer).__name__))
+    os.makedirs(directory, exist_ok=True)
+    # the previous config goes first, so that a partial export is never loaded
+    if os.path.exists(os.path.join(directory, CONFIG)):
+        os.remove(os.path.join(directory, CONFIG))
+
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, feature in vectorizer.vocabulary_.items():
+        terms[feature] = term.encode('utf-8')
+
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in terms], out=offsets[1:])
+    with open(os.path.join(directory, TERMS), "wb") as file:
+        for term in terms:
+            file.write(term)
+    np.save(os.path.join(directory, OFFSETS), offsets)
+
+    # linear probing, at most half full
+    size = 1
+    while size < 2 * len(terms):
+        size *= 2
+    hashes = np.array([zlib.crc32(term) for term in terms], dtype=np.uint32)
+    table = np.full(size, -1, dtype=np.int32 if len(terms) < 2 ** 31 else np.int64)
+    mask = size - 1
+    for feature, term_hash in enumerate(hashes.tolist()):
+        slot = term_hash & mask
+        while table[slot] >= 0:
+            slot = (slot + 1) & mask
+        table[slot] = feature
+    np.save(os.path.join(directory, HASHES), hashes)
+    np.save(os.path.join(directory, TABLE), table)
+
+    if vectorizer.use_idf:
+        np.save(os.path.join(directory, IDF), np.asarray(vectorizer.idf_, dtype=np.float64))
+
+    shell = copy.copy(vectorizer)
+    for attribute in ('vocabulary_', 'stop_words_', 'fixed_vocabulary_', '_tfidf'):
+        shell.__dict__.pop(attribute, None)
+    with open(os.path.join(directory, SHELL), "wb") as file:
+        dump(shell, file)
+
+    with open(os.path.join(directory, CONFIG), "w") as file:
+        json.dump({"version": FORMAT_VERSION, "features": len(terms)}, file)
+
+
+class CompactVectorizer():
+    """Memory-mapped TfidfVectorizer, giving the same matrices as the original
+    """
+
+    def __init__(self, directory: str):
+        """Opens a vectorizer saved by export_vectorizer
+
+        Args:
+            directory (str): Folder of the compact format
+        """
+        self.directory = directory
+        with open(os.path.join(directory, CONFIG)) as file:
+            config = json.load(file)
+        if config["version"] != FORMAT_VERSION:
+            raise ValueError("{} has format {}, expected {}".format(directory, config["version"], FORMAT_VERSION))
+        self.features: int = config["features"]
+        with open(os.path.join(directory, SHELL), "rb") as file:
+            self.shell: TfidfVectorizer = load(file)
+
+        self.offsets = np.load(os.path.join(directory, OFFSETS), mmap_mode='r')
+        self.hashes = np.load(os.path.join(directory, HASHES), mmap_mode='r')
+        self.table = np.load(os.path.join(directory, TABLE), mmap_mode='r')
+        # mmap refuses empty files
+        with open(os.path.join(directory, TERMS), "rb") as file:
+            self.terms = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.path.getsize(os.path.join(directory, TERMS)) > 0 else b''
+
+        # TfidfTransformer.idf_ would build a diagonal matrix as large as the vocabulary
+        self.idf = np.load(os.path.join(directory, IDF), mmap_mode='r') if self.shell.use_idf else None
+        self.columns: Dict[str, int] = {}
+        self.analyzer = self.shell.build_analyzer()
+
+    def __getstate__(self):
+        # worker processes open the files again
+        return {"directory": self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"])
+
+    def __getattr__(self, name: str):
+        # settings of the vectorizer, e.g. norm or use_idf
+        if name == "shell" or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.shell, name)
+
+    def term(self, feature: int) -> str:
+        return self.terms[int(self.offsets[feature]):int(self.offsets[feature + 1])].decode('utf-8')
+
+    def lookup(self, terms: List[str]) -> np.ndarray:
+        """Features of terms, -1 for those not in the vocabulary
+
+        Args:
+            terms (List[str]): Terms to look up
+
+        Returns:
+            np.ndarray: Feature of each term
+        """
+        data = [term.encode('utf-8') for term in terms]
+        hashes = np.fromiter((zlib.crc32(term) for term in data), dtype=np.uint32, count=len(data))
+        features = np.full(len(data), -1, dtype=np.int64)
+        if len(self.table) == 0:
+            return features
+        mask = len(self.table) - 1
+        slots = hashes.astype(np.int64) & mask
+        # all terms probe together, one slot further at each round
+        pending = np.arange(len(data))
+        while len(pending):
+            candidates = self.table[slots[pending]].astype(np.int64)
+            found = np.zeros(len(pending), dtype=bool)
+            occupied = np.flatnonzero(candidates >= 0)
+            same_hash = occupied[self.hashes[candidates[occupied]] == hashes[pending[occupied]]]
+            starts = self.offsets[candidates[same_hash]].tolist()
+            stops = self.offsets[candidates[same_hash] + 1].tolist()
+            for index, start, stop in zip(same_hash.tolist(), starts, stops):
+                if self.terms[start:stop] == data[pending[index]]:
+                    features[pending[index]] = candidates[index]
+                    found[index] = True
+            pending = pending[(candidates >= 0) & ~found]
+            slots[pending] = (slots[pending] + 1) & mask
+        return features
+
+    def column(self, term: str) -> int:
+        """Feature of a term, -1 if it is not in the vocabulary
+        """
+        return int(self.lookup([term])[0])
+
+    def count(self, raw_documents) -> csr_matrix:
+        """Term counts, as CountVectorizer.transform gives them
+        """
+        if isinstance(raw_documents, str):
+            raise ValueError("Iterable over raw text documents expected, string object received.")
+        documents = [self.analyzer(document) for document in raw_documents]
+
+        # the terms never seen by this vectorizer are looked up together
+        columns = self.columns
+        new_terms = list({term for terms in documents for term in terms if term not in columns})
+        if len(columns) + len(new_terms) > CACHE_SIZE:
+            columns.clear()
+            new_terms = list({term for terms in documents for term in terms})
+        columns.update(zip(new_terms, self.lookup(new_terms).tolist()))
+
+        features: List[int] = []
+        values: List[int] = []
+        indptr = [0]
+        for terms in documents:
+            counts: Dict[int, int] = {}
+            for term in terms:
+                feature = columns[term]
+                if feature >= 0:
+                    counts[feature] = counts.get(feature, 0) + 1
+            features.extend(counts)
+            values.extend(counts.values())
+            indptr.append(len(features))
+
+        X = csr_matrix((np.asarray(values, dtype=np.intc), np.asarray(features, dtype=np.int64),
+                        np.asarray(indptr, dtype=np.int64)),
+                       shape=(len(indptr) - 1, self.features), dtype=self.shell.dtype)
+        X.sort_indices()
+        if self.shell.binary:
+            X.data.fill(1)
+        return X
+
+    def transform(self, raw_documents) -> csr_matrix:
+        """Transforms documents to a TF-IDF matrix, as TfidfVectorizer.transform
+
+        Args:
+            raw_documents: Iterable of strings
+
+        Returns:
+            csr_matrix: Same matrix as the original vectorizer gives
+        """
+        # the steps of TfidfTransformer.transform
+        X = self.count(raw_documents)
+        if X.dtype != np.float64 and X.dtype != np.float32:
+            X = X.astype(np.float64)
+        if self.shell.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.idf is not None:
+            X = X.astype(np.float64, copy=False)
+            X.data *= self.idf[X.indices]
+            if DESCENDING:
+                rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+                order = X.indptr[rows] + X.indptr[rows + 1] - 1 - np.arange(X.nnz)
+                X = csr_matrix((X.data[order], X.indices[order], X.indptr), shape=X.shape)
+        if self.shell.norm:
+            X = normalize(X, norm=self.shell.norm, copy=False)
+        return X
+
+    def build_analyzer(self):
+        return self.analyzer
+
+    @property
+    def idf_(self) -> np.ndarray:
+        if self.idf is None:
+            raise AttributeError("idf_")
+        return self.idf
+
+    @property
+    def vocabulary_(self) -> Mapping[str, int]:
+        return CompactVocabulary(self)
+
+    def get_feature_names(self) -> List[str]:
+        return [self.term(feature) for feature in range(self.features)]
+
+    def get_feature_names_out(self) -> np.ndarray:
+        return np.asarray(self.get_feature_names(), dtype=object)
+
+
+class CompactVocabulary(Mapping):
+    """vocabulary_ of a CompactVectorizer, looking terms up in its hash table
+    instead of building the dict
+    """
+
+    def __init__(self, vectorizer: CompactVectorizer):
+        self.vectorizer = vectorizer
+
+    def __getitem__(self, term: str) -> int:
+        feature = self.vectorizer.column(term)
+        if feature < 0:
+            raise KeyError(term)
+        return feature
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and self.vectorizer.column(term) >= 0
+
+    def __len__(self) -> int:
+        return self.vectorizer.features
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.vectorizer.term(feature) for feature in range(self.vectorizer.features))
+
+
+def load_vectorizer(path: str):
+    """Loads a vectorizer saved by vectorizer.py, from its compact format when
+    there is an up to date one
+
+    Args:
+        path (str): Pickled vectorizer
+
+    Returns:
+        The vectorizer, or a CompactVectorizer transforming like it
+    """
+    directory = compact_path(path)
+    config = os.path.join(directory, CONFIG)
+    if os.path.exists(config) and os.path.getmtime(config) >= os.path.getmtime(path):
+        return CompactVectorizer(directory)
+    with open(path, "rb") as file:
+        return load(file)
+
+
+# Run in a fresh interpreter for each format, so that peak memory is comparable
+MEASURE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+documents = json.load(sys.stdin)
+from compact import CompactVectorizer
+from pickle import load
+# modules both formats need, outside of the measure
+import corpus.tokenizer, sklearn.feature_extraction.text
+def rss():
+    # resident MB; the peak (ru_maxrss) survives exec, so it would include the parent's
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+before = rss()
+start = time.perf_counter()
+if {compact}:
+    vectorizer = CompactVectorizer({path!r})
+else:
+    vectorizer = load(open({path!r}, "rb"))
+loaded = time.perf_counter() - start
+loaded_memory = rss() - before
+start = time.perf_counter()
+vectorizer.transform(documents)
+print(json.dumps([loaded, loaded_memory, time.perf_counter() - start, rss() - before]))
+"""
+
+
+def measure(path: str, documents: List[str]):
+    """Prints the load time and memory of both formats, then those of a first transform
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name, compact, location in (("pickle", False, path), ("compact", True, compact_path(path))):
+        script = MEASURE.format(root=root, compact=compact, path=location)
+        output = subprocess.run([sys.executable, "-c", script], input=json.dumps(documents),
+                                capture_output=True, text=True, check=True)
+        loaded, loaded_memory, transformed, memory = json.loads(output.stdout.strip().splitlines()[-1])
+        print("{}: load {:.3f}s, +{:.1f} MB resident; transform of {} blogs {:.3f}s, +{:.1f} MB resident"
+              .format(name, loaded, loaded_memory, len(documents), transformed, memory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports a pickled TfidfVectorizer to the compact format, "
+                                     "next to it, and compares their load time and memory")
+
+    parser.add_argument("vectorizer", help="Pickled vectorizer, e.g. data/vectorizers/tfidf.vec")
+
+    parser.add_argument("--measure", metavar="corpus",
+                        help="Only compare both formats, transforming blogs of this corpus")
+
+    parser.add_argument("--blogs", type=int, default=100,
+                        help="Number of blogs transformed by --measure (default: %(default)s)")
+
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        from loader import load_corpus
+        blogs = load_corpus(args.measure, columns=['blog'], categorize_age=False, verbose=False)['blog']
+        measure(args.vectorizer, blogs[:args.blogs].tolist())
+        return
+
+    start = time.perf_counter()
+    with open(args.vectorizer, "rb") as file:
+        vectorizer = load(file)
+    try:
+        export_vectorizer(vectorizer, compact_path(args.vectorizer))
+    except TypeError as error:
+        sys.exit(str(error))
+
+    # same matrices as the pickle
+    check = list(vectorizer.vocabulary_)[:1000]
+    compact = CompactVectorizer(compact_path(args.vectorizer))
+    expected, actual = vectorizer.transform(check), compact.transform(check)
+    if not all(np.array_equal(getattr(expected, array), getattr(actual, array))
+               for array in ("data", "indices", "indptr")):
+        sys.exit("The compact vectorizer transforms differently")
+    print("Saved {} in {:.1f}s".format(compact_path(args.vectorizer), time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Compiled corpus
+
+Compiles a blog csv directory into a columnar format on disk, so that the
+corpus can be memory-mapped instead of re-parsed at every run.
+
+A compiled corpus is a directory holding one .npy file per label column,
+the concatenated utf-8 text of every blog with an offsets table, and a
+manifest recording the size and modification time of each source csv.
+The cache rebuilds itself whenever the source directory changes.
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+
+FORMAT_VERSION = 1
+COLUMNS = ('bloggerID', 'gender', 'age', 'zodiac', 'blog')
+LABEL_COLUMNS = ('bloggerID', 'gender', 'age', 'zodiac')
+MANIFEST = "manifest.json"
+BLOGS = "blog.bin"
+BLOG_OFFSETS = "blog_offsets.npy"
+FILE_OFFSETS = "file_offsets.npy"
+
+
+def source_files(directory: str) -> List[str]:
+    """Lists the csv file names of the corpus in a stable order
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+
+    Returns:
+        List[str]: Names of the csv files, sorted
+    """
+    return sorted(file for file in os.listdir(directory) if file.endswith(".csv"))
+
+
+def fingerprint(directory: str) -> List[Tuple[str, int, int]]:
+    """Describes the state of the source directory
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+
+    Returns:
+        List[Tuple[str, int, int]]: Name, size and modification time of each csv
+    """
+    stats = []
+    for file in source_files(directory):
+        stat = os.stat(os.path.join(directory, file))
+        stats.append((file, stat.st_size, stat.st_mtime_ns))
+    return stats
+
+
+def default_location(directory: str) -> str:
+    """Where the compiled version of a corpus is stored by default
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+
+    Returns:
+        str: data/compiled/{name}-{hash of the absolute path}
+    """
+    absolute = os.path.abspath(directory)
+    digest = hashlib.sha1(absolute.encode('utf-8')).hexdigest()[:10]
+    return os.path.join("data", "compiled", "{}-{}".format(os.path.basename(absolute), digest))
+
+
+def is_stale(directory: str, location: str) -> bool:
+    """Checks whether the compiled corpus is missing or out of date
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+        location (str): Directory of the compiled corpus
+
+    Returns:
+        bool: True if the corpus has to be compiled again
+    """
+    try:
+        with open(os.path.join(location, MANIFEST)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return True
+    if manifest.get("version") != FORMAT_VERSION:
+        return True
+    return [tuple(entry) for entry in manifest["files"]] != fingerprint(directory)
+
+
+def compile_corpus(directory: str, location: str) -> "CompiledCorpus":
+    """Compiles the blog csv directory into a columnar format
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+        location (str): Directory where to put the compiled corpus
+
+    Returns:
+        CompiledCorpus: The freshly compiled corpus
+    """
+    # build in a sibling folder, then swap, so readers never see a partial cache
+    building = location.rstrip(os.sep) + ".building"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    stats = fingerprint(directory)
+    labels: Dict[str, List[np.ndarray]] = {column: [] for column in LABEL_COLUMNS}
+    blog_offsets: List[int] = [0]
+    file_offsets: List[int] = [0]
+
+    with open(os.path.join(building, BLOGS), "wb") as blogs:
+        for file, _, _ in stats:
+            dataframe = pd.read_csv(os.path.join(directory, file), names=COLUMNS,
+                                    dtype={'bloggerID': str, 'gender': str, 'age': np.int16,
+                                           'zodiac': str, 'blog': str},
+                                    na_filter=False, encoding='utf-8')
+            for column in LABEL_COLUMNS:
+                labels[column].append(dataframe[column].to_numpy())
+            for blog in dataframe['blog']:
+                encoded = blog.encode('utf-8')
+                blogs.write(encoded)
+                blog_offsets.append(blog_offsets[-1] + len(encoded))
+            file_offsets.append(file_offsets[-1] + len(dataframe))
+
+    for column in LABEL_COLUMNS:
+        values = np.concatenate(labels[column]) if labels[column] else np.array([])
+        if column == 'age':
+            values = values.astype(np.int16)
+        else:
+            values = values.astype(str)
+        np.save(os.path.join(building, "{}.npy".format(column)), values)
+    np.save(os.path.join(building, BLOG_OFFSETS), np.array(blog_offsets, dtype=np.int64))
+    np.save(os.path.join(building, FILE_OFFSETS), np.array(file_offsets, dtype=np.int64))
+
+    # the manifest is written last: its presence marks a complete cache
+    with open(os.path.join(building, MANIFEST), "w") as file:
+        json.dump({"version": FORMAT_VERSION, "source": os.path.abspath(directory),
+                   "files": stats}, file)
+
+    shutil.rmtree(location, ignore_errors=True)
+    os.replace(building, location)
+    return CompiledCorpus(location)
+
+
+def open_corpus(directory: str, location: Optional[str] = None) -> "CompiledCorpus":
+    """Opens the compiled version of a corpus, compiling it first if needed
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+        location (str, optional): Directory of the compiled corpus.
+            Defaults to default_location(directory).
+
+    Returns:
+        CompiledCorpus: The memory-mapped corpus
+    """
+    if location is None:
+        location = default_location(directory)
+    if is_stale(directory, location):
+        print("Compiling {} into {}".format(directory, location), file=sys.stderr)
+        return compile_corpus(directory, location)
+    return CompiledCorpus(location)
+
+
+class CompiledCorpus():
+    """Read-only, memory-mapped view over a compiled corpus
+    """
+
+    def __init__(self, location: str):
+        """Memory-maps the compiled corpus at the given location
+
+        Args:
+            location (str): Directory of the compiled corpus
+        """
+        self.location = location
+
+        with open(os.path.join(location, MANIFEST)) as file:
+            self.files: List[str] = [entry[0] for entry in json.load(file)["files"]]
+
+        self.labels: Dict[str, np.ndarray] = {
+            column: np.load(os.path.join(location, "{}.npy".format(column)), mmap_mode='r')
+            for column in LABEL_COLUMNS}
+        self.blog_offsets: np.ndarray = np.load(os.path.join(location, BLOG_OFFSETS), mmap_mode='r')
+        self.file_offsets: np.ndarray = np.load(os.path.join(location, FILE_OFFSETS), mmap_mode='r')
+
+        # mmap refuses empty files
+        with open(os.path.join(location, BLOGS), "rb") as blogs:
+            if os.fstat(blogs.fileno()).st_size == 0:
+                self.blogs_buffer = b''
+            else:
+                self.blogs_buffer = mmap.mmap(blogs.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.blog_offsets) - 1
+
+    def blog(self, index: int) -> str:
+        """Text of the blog at the given row
+        """
+        return self.blogs_buffer[self.blog_offsets[index]:self.blog_offsets[index + 1]]\
+            .decode('utf-8')
+
+    def blogs(self, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Iterates over the text of the blogs in the given row range
+        """
+        if stop is None:
+            stop = len(self)
+        offsets = self.blog_offsets[start:stop + 1].tolist()
+        buffer = self.blogs_buffer
+        for begin, end in zip(offsets, offsets[1:]):
+            yield buffer[begin:end].decode('utf-8')
+
+    def frame(self, columns: Sequence[str] = COLUMNS,
+              start: int = 0, stop: Optional[int] = None) -> DataFrame:
+        """Materializes the given columns and row range as a DataFrame
+
+        Args:
+            columns (Sequence[str], optional): Columns to keep. Defaults to all.
+            start (int, optional): First row. Defaults to 0.
+            stop (int, optional): Row after the last. Defaults to the end.
+
+        Returns:
+            DataFrame: Same layout as loader.load_corpus, with raw ages
+        """
+        if stop is None:
+            stop = len(self)
+        data = {}
+        for column in columns:
+            if column == 'blog':
+                data[column] = list(self.blogs(start, stop))
+            else:
+                data[column] = np.asarray(self.labels[column][start:stop])
+        return DataFrame(data, columns=list(columns))
+
+    def file_frames(self, columns: Sequence[str] = COLUMNS) -> Iterator[Tuple[str, DataFrame]]:
+        """Iterates over the source files, one DataFrame per file
+
+        Yields:
+            Iterator[Tuple[str, DataFrame]]: Name of the source csv and its rows
+        """
+        for index, file in enumerate(self.files):
+            yield file, self.frame(columns, int(self.file_offsets[index]),
+                                   int(self.file_offsets[index + 1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiles a blog csv directory for fast loading")
+
+    parser.add_argument("corpus", help="Directory of the blog csv corpus")
+
+    parser.add_argument("--location", help="Where to put the compiled corpus "
+                        "(default: data/compiled/{corpus name}-{hash})")
+
+    parser.add_argument("--force", help="Compile even if the cache is up to date",
+                        const=True, action='store_const', default=False)
+
+    args = parser.parse_args()
+    location = args.location if args.location is not None else default_location(args.corpus)
+
+    start = time.perf_counter()
+    if args.force or is_stale(args.corpus, location):
+        corpus = compile_corpus(args.corpus, location)
+        print("Compiled {} blogs from {} files into {} in {:.2f}s"
+              .format(len(corpus), len(corpus.files), location, time.perf_counter() - start))
+    else:
+        print("{} is up to date".format(location))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Corpus statistics
+
+Profiles a corpus in a single pass, each csv file being read once:
+the multiplicity of each label (as count_labels.py), the histogram of
+blog lengths with their min and max (as count_lengths.py) and the
+token and type counts with the vocabulary (as count_type.py).
+
+Blogs are counted as csv rows, so blogs spanning several lines count once.
+Only the vocabulary grows with the corpus, everything else is a counter.
+"""
+
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional
+import pandas as pd
+from preprocessing import Labels
+from count_labels import increment_key
+from count_type import is_binary, write_vocabulary
+
+# upper bound of each length bin, in words; count_lengths.py puts 50 in "<50"
+LENGTH_BINS = ((50, "<50"), (99, "50-99"), (199, "100-199"), (399, "200-399"))
+LONGEST_BIN = "400+"
+
+
+class FileStatistics(NamedTuple):
+    """Statistics of one csv file of the corpus
+    """
+    labels: Labels
+    blogs: int
+    lengths: Dict[str, int]
+    min_length: Optional[int]
+    max_length: Optional[int]
+    vocabulary: Counter
+
+
+def length_bin(word_count: int) -> str:
+    for bound, name in LENGTH_BINS:
+        if word_count <= bound:
+            return name
+    return LONGEST_BIN
+
+
+def profile_file(path: str) -> FileStatistics:
+    """Reads a csv file of the corpus once and computes all of its statistics
+
+    Args:
+        path (str): Csv file named {ID}.{gender}.{age}.{zodiac}.csv
+
+    Returns:
+        FileStatistics: Statistics of the file
+    """
+    id, gender, age, zodiac, _ = os.path.basename(path).split('.')
+    labels = Labels(id, gender, age, zodiac)
+
+    dataframe = pd.read_csv(path, names=('ID', 'Gender', 'Age', 'Zodiac', 'Blog'),
+                            dtype=str, na_filter=False)
+    lengths = {name: 0 for _, name in LENGTH_BINS}
+    lengths[LONGEST_BIN] = 0
+    word_counts: List[int] = []
+    vocabulary: Counter = Counter()
+    for blog in dataframe['Blog']:
+        words = blog.split()
+        word_counts.append(len(words))
+        lengths[length_bin(len(words))] += 1
+        vocabulary.update(words)
+
+    return FileStatistics(labels, len(dataframe), lengths,
+                          min(word_counts, default=None), max(word_counts, default=None), vocabulary)
+
+
+class Statistics():
+    """Statistics of a whole corpus, merged file by file
+    """
+
+    def __init__(self):
+        self.genders: Dict[str, int] = {}
+        self.ages: Dict[int, int] = {}
+        self.zodiacs: Dict[str, int] = {}
+        self.lengths: Dict[str, int] = {name: 0 for _, name in LENGTH_BINS}
+        self.lengths[LONGEST_BIN] = 0
+        self.min_length: Optional[int] = None
+        self.max_length: Optional[int] = None
+        self.vocabulary: Counter = Counter()
+        # types seen after each file, as types_per_file.csv
+        self.types_per_file: List[int] = []
+
+    def add(self, statistics: FileStatistics):
+        """Merges the statistics of the next file
+        """
+        increment_key(statistics.labels.gender, self.genders, statistics.blogs)
+        increment_key(statistics.labels.age, self.ages, statistics.blogs)
+        increment_key(statistics.labels.zodiac, self.zodiacs, statistics.blogs)
+
+        for name, count in statistics.lengths.items():
+            self.lengths[name] += count
+        if statistics.min_length is not None:
+            self.min_length = statistics.min_length if self.min_length is None\
+                else min(self.min_length, statistics.min_length)
+            self.max_length = statistics.max_length if self.max_length is None\
+                else max(self.max_length, statistics.max_length)
+
+        self.vocabulary.update(statistics.vocabulary)
+        self.types_per_file.append(len(self.vocabulary))
+
+    def save(self, directory: str, vocabulary: str = "vocabulary.json", count: str = "types_per_file.csv"):
+        """Writes labels.json, lengths.json, the vocabulary and the types seen per file
+
+        Args:
+            directory (str): Where to put the results
+            vocabulary (str, optional): Name of the vocabulary. Defaults to vocabulary.json.
+            count (str, optional): Name of the types seen per file. Defaults to types_per_file.csv.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "labels.json"), "w") as file:
+            all_labels = {"genders": self.genders, "ages": self.ages, "zodiacs": self.zodiacs}
+            json.dump(all_labels, file, indent=4, ensure_ascii=True)
+
+        with open(os.path.join(directory, "lengths.json"), "w") as file:
+            lengths = dict(self.lengths, min=self.min_length, max=self.max_length)
+            json.dump(lengths, file, indent=4, ensure_ascii=True)
+
+        write_vocabulary(os.path.join(directory, vocabulary), self.vocabulary)
+        with open(os.path.join(directory, count), "w") as file:
+            for types in self.types_per_file:
+                file.write("{}\n".format(types))
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="Profiles the labels, blog lengths and vocabulary "
+                                     "of a corpus in a single pass")
+
+    parser.add_argument('directory', help="Where the corpus is located")
+
+    parser.add_argument('results', help="Where to put the results")
+
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Number of processes reading the files (default: %(default)s)")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse()
+
+    files = []
+    for file in os.listdir(args.directory):
+        path = os.path.join(args.directory, file)
+        if file.endswith(".csv") and not os.path.isdir(path) and not is_binary(path):
+            files.append(path)
+
+    statistics = Statistics()
+    if args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            # results come in file order
+            for file_statistics in pool.map(profile_file, files,
+                                             chunksize=max(1, len(files) // (args.jobs * 16))):
+                statistics.add(file_statistics)
+    else:
+        for path in files:
+            statistics.add(profile_file(path))
+    statistics.save(args.results)
+
+    print("""Finished counting:
+        {blogs} blogs in {files} files
+        {word_count} words in total
+        {type_count} types in total
+        """.format(blogs=sum(statistics.genders.values()), files=len(files),
+                   word_count=sum(statistics.vocabulary.values()), type_count=len(statistics.vocabulary)))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,19 +9,29 @@ at the end of reading each file. Optionally produces an execution
 time csv file.
 
 The vocabulary of the corpus is stored in a json file, by default
-'vocabulary.json'.
+'vocabulary.json', one word per line from the most frequent to the
+least, so that the top words can be read without loading it all.
+
+Files are counted in parallel with --jobs, the counts of each file
+being merged in file order.
 """
 
 import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import json
 import os
 import sys
-from typing import Any, Iterator
-import subprocess
+from typing import Any, Iterator, List, Optional, Tuple
 import time
 import pandas as pd
 from queue import Queue
 import threading
+from cache import CompiledCorpus, open_corpus
+
+# bytes of a text file, as the file command sees them
+TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+HEADER_SIZE = 8192
 
 def read_words(path: str) -> Iterator[str]:
     """Reads a file and give an iterator over its words
@@ -57,12 +67,11 @@ def load_csv_files(directory: str) -> Iterator[str]:
             continue
 
         # ignore binary files
-        process = subprocess.Popen(
-            ['file', '--mime', path], stdout=subprocess.PIPE, text=True)
-        mime, error = process.communicate()
-        if error is not None:
+        try:
+            if is_binary(path):
+                continue
+        except OSError as error:
             print(error, file=sys.stderr)
-        if 'charset=binary' in mime:
             continue
 
         # only take csv
@@ -84,6 +93,103 @@ def verify(args: argparse.Namespace):
             "Directory not found: {}".format(args.directory))
 
 
+def is_binary(path: str) -> bool:
+    """Whether a file is binary, from the control characters of its header
+
+    Args:
+        path (str): File to check
+
+    Returns:
+        bool: True when file --mime would report charset=binary
+    """
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    return bool(header.translate(None, TEXT_BYTES))
+
+
+def count_file(path: str) -> Counter:
+    """Counts the words of a csv file of the corpus
+
+    Args:
+        path (str): Path to the csv
+
+    Returns:
+        Counter: Number of occurrences of each word
+    """
+    counts: Counter = Counter()
+    try:
+        for blog in open_csv(path):
+            counts.update(blog.split())
+    except OSError as error:
+        print(error, file=sys.stderr)
+    return counts
+
+
+# compiled corpus of the counting processes
+compiled_corpus: Optional[CompiledCorpus] = None
+
+def open_compiled(directory: str):
+    global compiled_corpus
+    compiled_corpus = open_corpus(directory)
+
+def count_compiled_file(bounds: Tuple[int, int]) -> Counter:
+    """Counts the words of a file of the compiled corpus, see open_compiled
+
+    Args:
+        bounds (Tuple[int, int]): First and last blog of the file, exclusive
+
+    Returns:
+        Counter: Number of occurrences of each word
+    """
+    counts: Counter = Counter()
+    for blog in compiled_corpus.blogs(*bounds):
+        counts.update(blog.split())
+    return counts
+
+
+def stop_timing():
+    # only the main process logs the time
+    Timer.is_timing = False
+
+
+def write_vocabulary(path: str, vocabulary: Counter):
+    """Writes the vocabulary as a json object, one word per line
+    from the most frequent to the least
+
+    Args:
+        path (str): Json file
+        vocabulary (Counter): Number of occurrences of each word
+    """
+    with open(path, 'w') as voc_file:
+        voc_file.write("{\n")
+        separator = ""
+        for word, frequency in vocabulary.most_common():
+            voc_file.write("{}{}: {}".format(separator, json.dumps(word), frequency))
+            separator = ",\n"
+        voc_file.write("\n}\n")
+
+
+def top_k(path: str, k: int) -> List[Tuple[str, int]]:
+    """Reads the k most frequent words of a vocabulary written by write_vocabulary
+
+    Args:
+        path (str): Json file
+        k (int): Number of words
+
+    Returns:
+        List[Tuple[str, int]]: Words and their number of occurrences, most frequent first
+    """
+    words: List[Tuple[str, int]] = []
+    with open(path) as voc_file:
+        voc_file.readline()
+        for line in voc_file:
+            if len(words) == k or line.startswith("}"):
+                break
+            word, frequency = line.rstrip().rstrip(",").rsplit(": ", 1)
+            words.append((json.loads(word), int(frequency)))
+    return words
+
+
 def open_csv(path: str) -> Iterator[str]:
     """Reads the text value of the csv blog line by line
 
@@ -101,7 +207,8 @@ def open_csv(path: str) -> Iterator[str]:
     #     blogreader = csv.reader(csv_file)
     #     for row in blogreader:
     #         yield row[-1]
-    dataframe = pd.read_csv(path, names=('ID', 'Gender', 'Age', 'Zodiac', 'Blog'))
+    dataframe = pd.read_csv(path, names=('ID', 'Gender', 'Age', 'Zodiac', 'Blog'),
+                            dtype=str, na_filter=False)
     for row in dataframe['Blog']:
         yield row
 
@@ -198,6 +305,19 @@ def parse() -> argparse.Namespace:
             the token type count seen so far accumulated per file (default: types_per_file.csv)""",
                         default='count_type.csv')
 
+    parser.add_argument('--compiled',
+                        help="""Whether to read the compiled corpus (see cache.py)
+        instead of parsing the csv files""",
+                        const=True, action='store_const', default=False)
+
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="""Number of processes counting the files
+                        (default: %(default)s)""")
+
+    parser.add_argument('--top', metavar='k', type=int,
+                        help="""Prints the k most frequent words
+                        of the vocabulary""")
+
     parser.add_argument('--json', metavar='vocabulary',
                         help="""Name of the json of the vocabulary
                         (default: vocabulary.json)""",
@@ -212,7 +332,6 @@ def main():
 
     args = parse()
     verify(args)
-    files = load_csv_files(args.directory)
 
     # initiate log files for time and count
     if not os.path.exists("./data"):
@@ -221,27 +340,44 @@ def main():
         Timer("data/{}".format("time_count_type.csv"))
     Logger("data/{}".format(args.count if args.count is not None else "types_per_file.csv"))
 
-    # initiate empty dictionary and counter
-    vocabulary = dict()
-    count = 0
-    types = 0
-
-    # populate dictionary
-    for file in files:
-        for word in read_words(file):
-            count += 1
-            if word in vocabulary:
-                vocabulary[word] += 1
-            else:
-                vocabulary[word] = 1
-                types += 1
-
-        Logger.get_current_instance().log(types)
-
-    # produce a json vocabulary
-    with open("data/{}".format(args.json if args.json is not None else "vocabulary.json"), 'w') as voc_file:
-        json_representation = json.dumps(vocabulary)
-        voc_file.write(json_representation)
+    if args.compiled:
+        open_compiled(args.directory)
+        offsets = [int(offset) for offset in compiled_corpus.file_offsets]
+        files: List[Any] = list(zip(offsets[:-1], offsets[1:]))
+        count_words = count_compiled_file
+        initializer, initargs = open_compiled, (args.directory,)
+    else:
+        files = list(load_csv_files(args.directory))
+        count_words = count_file
+        initializer, initargs = stop_timing, ()
+
+    pool = None
+    if args.jobs > 1:
+        pool = ProcessPoolExecutor(max_workers=args.jobs, initializer=initializer, initargs=initargs)
+        # results come in file order
+        counts_per_file = pool.map(count_words, files, chunksize=max(1, len(files) // (args.jobs * 16)))
+    else:
+        counts_per_file = map(count_words, files)
+
+    # merge the counts, tracking the types seen after each file
+    vocabulary: Counter = Counter()
+    for counts in counts_per_file:
+        if Timer.is_timing and (pool is not None or args.compiled):
+            Timer.get_current_instance().log()
+        vocabulary.update(counts)
+        Logger.get_current_instance().log(len(vocabulary))
+    if pool is not None:
+        pool.shutdown()
+    count = sum(vocabulary.values())
+    types = len(vocabulary)
+
+    # produce a json vocabulary, most frequent words first
+    vocabulary_path = "data/{}".format(args.json if args.json is not None else "vocabulary.json")
+    write_vocabulary(vocabulary_path, vocabulary)
+    Logger.get_current_instance().block_until_logged()
+    if args.top is not None:
+        for word, frequency in top_k(vocabulary_path, args.top):
+            print(word, frequency, sep='\t')
 
     # final message
     print(
@@ -1,4 +1,22 @@
-from typing import Callable, Dict, List, Tuple
+"""
+Estimates how preprocessing changes a vocabulary (see count_type.py)
+
+reductive_mapping and expansive_mapping estimate one mapping. The batch
+engine below loads the vocabulary once as arrays and estimates many
+candidate mappings and their compositions in one run: each mapping is
+called once per distinct word over all the compositions, compositions
+reuse the result of their prefix, merges are counted with NumPy, and
+the calls are spread across processes. Run this file for a table.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, combinations
+import json
+import sys
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
 
 def reductive_mapping(voc: Dict[str, int], mapping: Callable[[str], str]) -> Tuple[Dict[str, int], int, int]:
     """Estimates how the vocabulary will change after this reductive mapping
@@ -42,4 +60,257 @@ def expansive_mapping(voc: Dict[str, int], mapping: Callable[[str], List[str]]):
             try_to_add_to_voc(preprocessed_voc, separated_fragment, val)
         
 
-    return preprocessed_voc, len(voc) - len(preprocessed_voc), tokens_affected
\ No newline at end of file
+    return preprocessed_voc, len(voc) - len(preprocessed_voc), tokens_affected
+
+
+class Candidate(NamedTuple):
+    """A mapping to estimate
+
+    name: Name in the results table
+    mapping: Token to token (reductive) or token to tokens (expansive)
+    expansive: Whether mapping returns a list of tokens
+    """
+    name: str
+    mapping: Callable
+    expansive: bool = False
+
+
+def lowercase(word: str) -> str:
+    return word.lower()
+
+
+def builtin_candidates() -> Dict[str, Candidate]:
+    """Candidates known by name on the command line
+    """
+    try:
+        from preprocessing import map_nonascii, map_number
+    except ImportError:
+        from corpus.preprocessing import map_nonascii, map_number
+    candidates = [
+        Candidate("lowercase", lowercase),
+        Candidate("number", map_number),
+        Candidate("nonascii", map_nonascii),
+    ]
+    try:
+        from nltk.stem import PorterStemmer
+        candidates.append(Candidate("stem", PorterStemmer().stem))
+        try:
+            from tokenizer import FastTweetTokenizer
+        except ImportError:
+            from corpus.tokenizer import FastTweetTokenizer
+        # words of count_type.py are split on whitespace only
+        candidates.append(Candidate("tweet", FastTweetTokenizer().tokenize, expansive=True))
+    except ImportError:
+        pass
+    return {candidate.name: candidate for candidate in candidates}
+
+
+def load_vocabulary(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Loads a vocabulary json as arrays, in the order of the file
+
+    Args:
+        path (str): Json object of word counts, e.g. written by count_type.py
+
+    Returns:
+        np.ndarray: Words, as objects
+        np.ndarray: Number of occurrences of each word
+    """
+    with open(path) as file:
+        vocabulary: Dict[str, int] = json.load(file)
+    words = np.empty(len(vocabulary), dtype=object)
+    words[:] = list(vocabulary)
+    return words, np.fromiter(vocabulary.values(), dtype=np.int64, count=len(vocabulary))
+
+
+# A mapped vocabulary: the code of each word's type, and the distinct types
+Mapped = Tuple[np.ndarray, np.ndarray]
+
+# Words per task of the worker processes
+SHARD_SIZE = 20000
+
+
+def map_words(candidate: Candidate, words: List[str]) -> list:
+    return [candidate.mapping(word) for word in words]
+
+
+class Estimator():
+    """Estimates compositions of mappings on a vocabulary. Each mapping is called
+    once per distinct word over all compositions, and compositions reuse the
+    result of their prefix.
+    """
+
+    def __init__(self, words: np.ndarray, counts: np.ndarray, pool: Optional[ProcessPoolExecutor] = None):
+        """
+        Args:
+            words (np.ndarray): Words of the vocabulary, in its order
+            counts (np.ndarray): Number of occurrences of each word
+            pool (ProcessPoolExecutor, optional): Workers calling the mappings. Defaults to none.
+        """
+        self.words = words
+        self.counts = counts
+        self.total = int(counts.sum())
+        self.pool = pool
+        # composition -> mapped vocabulary
+        self.mapped: Dict[Tuple[str, ...], Mapped] = {(): (np.arange(len(words)), words)}
+        # candidate -> word -> output
+        self.memos: Dict[str, Dict] = {}
+
+    def call(self, candidate: Candidate, words: Sequence[str]) -> list:
+        """Outputs of the mapping on the words, calling it once per new word
+        """
+        memo = self.memos.setdefault(candidate.name, {})
+        missing = [word for word in words if word not in memo]
+        if self.pool is not None and len(missing) > SHARD_SIZE:
+            shards = [missing[start:start + SHARD_SIZE] for start in range(0, len(missing), SHARD_SIZE)]
+            outputs = chain.from_iterable(self.pool.map(map_words, [candidate] * len(shards), shards))
+        else:
+            outputs = map_words(candidate, missing)
+        memo.update(zip(missing, outputs))
+        return [memo[word] for word in words]
+
+    def map(self, chain_: Sequence[Candidate]) -> Mapped:
+        names = tuple(candidate.name for candidate in chain_)
+        mapped = self.mapped.get(names)
+        if mapped is None:
+            codes, types = self.map(chain_[:-1])
+            outputs = np.empty(len(types), dtype=object)
+            outputs[:] = self.call(chain_[-1], types.tolist())
+            type_codes, types = pd.factorize(outputs)
+            mapped = self.mapped[names] = (type_codes[codes], types)
+        return mapped
+
+    def estimate(self, chain_: Sequence[Candidate]) -> Dict:
+        """Estimates a composition of mappings, applied from first to last.
+        Reductive compositions give the numbers of reductive_mapping on the composed
+        mapping; an expansive candidate is estimated alone, as expansive_mapping.
+
+        Args:
+            chain_ (Sequence[Candidate]): Mappings to compose
+
+        Returns:
+            Dict: One row of the results table
+        """
+        counts = self.counts
+        if any(candidate.expansive for candidate in chain_):
+            if len(chain_) != 1:
+                raise ValueError("expansive mappings are estimated alone")
+            fragments = self.call(chain_[0], self.words.tolist())
+            split = np.fromiter((len(fragment) != 1 for fragment in fragments), dtype=bool, count=len(counts))
+            types = len(set(chain.from_iterable(fragments)))
+            tokens_affected = int(counts[split].sum())
+        else:
+            codes, distinct = self.map(chain_)
+            # a word merges into a type seen earlier in the vocabulary
+            merged = np.ones(len(codes), dtype=bool)
+            merged[np.unique(codes, return_index=True)[1]] = False
+            types = len(distinct)
+            tokens_affected = int(counts[merged].sum())
+
+        words = len(counts)
+        return {"candidate": "+".join(candidate.name for candidate in chain_),
+                "types": types,
+                "type reduction": words - types,
+                "type reduction %": 100 * (words - types) / max(words, 1),
+                "tokens affected": tokens_affected,
+                "tokens affected %": 100 * tokens_affected / max(self.total, 1)}
+
+
+def compositions(candidates: Sequence[Candidate], depth: int) -> List[Tuple[Candidate, ...]]:
+    """Every candidate alone, then the compositions of up to depth reductive candidates,
+    in the given order
+    """
+    chains: List[Tuple[Candidate, ...]] = [(candidate,) for candidate in candidates]
+    reductive = [candidate for candidate in candidates if not candidate.expansive]
+    for size in range(2, depth + 1):
+        chains.extend(combinations(reductive, size))
+    return chains
+
+
+def estimate_all(words: np.ndarray, counts: np.ndarray, chains: Sequence[Sequence[Candidate]],
+                 jobs: int = 1) -> pd.DataFrame:
+    """Estimates many compositions of mappings on one vocabulary
+
+    Args:
+        words (np.ndarray): Words of the vocabulary, in its order
+        counts (np.ndarray): Number of occurrences of each word
+        chains (Sequence[Sequence[Candidate]]): Compositions to estimate
+        jobs (int, optional): Number of worker processes. Defaults to 1.
+
+    Returns:
+        pd.DataFrame: One row per composition
+    """
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    estimator = Estimator(words, counts, pool)
+    rows = [estimator.estimate(chain_) for chain_ in chains]
+    if pool is not None:
+        pool.shutdown()
+    return pd.DataFrame(rows).set_index("candidate")
+
+
+def compose(chain_: Sequence[Candidate]) -> Callable[[str], str]:
+    def composed(word: str) -> str:
+        for candidate in chain_:
+            word = candidate.mapping(word)
+        return word
+    return composed
+
+
+def check(words: np.ndarray, counts: np.ndarray, chains: Sequence[Sequence[Candidate]],
+          results: pd.DataFrame) -> int:
+    """Compares the table with reductive_mapping and expansive_mapping
+
+    Returns:
+        int: Number of compositions estimated differently
+    """
+    vocabulary = dict(zip(words.tolist(), counts.tolist()))
+    mismatches = 0
+    for chain_ in chains:
+        if chain_[0].expansive:
+            _, change, affected = expansive_mapping(vocabulary, chain_[0].mapping)
+        else:
+            _, change, affected = reductive_mapping(vocabulary, compose(chain_))
+        row = results.loc["+".join(candidate.name for candidate in chain_)]
+        if (change, affected) != (row["type reduction"], row["tokens affected"]):
+            mismatches += 1
+            print("Mismatch for {}: {} {} instead of {} {}".format(
+                row.name, row["type reduction"], row["tokens affected"], change, affected), file=sys.stderr)
+    return mismatches
+
+
+def main():
+    known = builtin_candidates()
+    parser = argparse.ArgumentParser(description="Estimates how candidate preprocessing mappings "
+                                     "and their compositions reduce a vocabulary")
+
+    parser.add_argument("vocabulary", help="Json vocabulary, e.g. data/vocabulary.json of count_type.py")
+
+    parser.add_argument("--candidates", nargs='+', choices=sorted(known),
+                        default=[name for name in ("lowercase", "number", "nonascii") if name in known],
+                        help="Mappings to estimate, composed in this order (default: %(default)s)")
+
+    parser.add_argument("--depth", type=int, default=3,
+                        help="Largest number of mappings composed (default: %(default)s)")
+
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes (default: %(default)s)")
+
+    parser.add_argument("--save", help="Also save the table as a csv file")
+
+    parser.add_argument("--check", help="Check the table against reductive_mapping and expansive_mapping",
+                        const=True, action='store_const', default=False)
+
+    args = parser.parse_args()
+    words, counts = load_vocabulary(args.vocabulary)
+    chains = compositions([known[name] for name in args.candidates], args.depth)
+    results = estimate_all(words, counts, chains, args.jobs)
+
+    print("{} types, {} tokens".format(len(words), int(counts.sum())))
+    print(results.to_string(float_format="{:.2f}".format))
+    if args.save is not None:
+        results.to_csv(args.save)
+    if args.check and check(words, counts, chains, results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,37 @@ Sets up a preprocessing pipeline
 """
 
 import argparse
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
 import os
-from pickle import dump, load
-from tempfile import TemporaryFile
+import sys
 import threading
-from threading import Event
-from typing import Callable, Iterator, List, Tuple, Union
-from queue import Queue
+from threading import Event, Semaphore
+import time
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from queue import Empty, Queue
+import numpy as np
 import pandas as pd
 from pandas.core.frame import DataFrame
+from pandas.core.series import Series
+
+# Number of token types whose mapping is remembered by a fused pipeline
+TOKEN_CACHE_SIZE = 1 << 20
+
+COLUMNS = ('ID', 'Gender', 'Age', 'Zodiac', 'Blog')
+
+# Record of a saved corpus, next to the preprocessed csv files
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
 
 
 class Labels():
     """Represents the labels of a data point (a blog)
     """
 
+    __slots__ = ('id', 'gender', 'age', 'zodiac')
+
     def __init__(self, id: str, gender: str, age: int, zodiac: str):
         """Reads the labels of the blog post and categorizes as needed
 
@@ -48,6 +64,136 @@ class Labels():
             .format(self.id, self.gender, self.age, self.zodiac)
 
 
+class LabelStore():
+    """Labels of many blogs, column by column: an integer code per blog in a
+    NumPy array, and a table of the values of each label. Ages are stored as
+    their category, which is its own code. Slices share the arrays of the store.
+    """
+
+    COLUMNS = ('id', 'gender', 'age', 'zodiac')
+    DTYPES = {'id': np.int32, 'gender': np.int8, 'age': np.int8, 'zodiac': np.int8}
+    # names of the label columns in train.py and predict.py
+    ALIASES = {'bloggerID': 'id'}
+
+    def __init__(self, capacity: int = 1024):
+        """Creates an empty label store
+
+        Args:
+            capacity (int, optional): Number of blogs before the arrays grow. Defaults to 1024.
+        """
+        self.size = 0
+        self.codes: Dict[str, np.ndarray] = {column: np.zeros(capacity, dtype=self.DTYPES[column])
+                                             for column in self.COLUMNS}
+        self.tables: Dict[str, List] = {column: [] for column in self.COLUMNS if column != 'age'}
+        self.indices: Dict[str, Dict] = {column: {} for column in self.tables}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def code(self, column: str, value) -> int:
+        index = self.indices[column]
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(self.tables[column])
+            self.tables[column].append(value)
+        return code
+
+    def reserve(self, count: int):
+        """Makes room for count more blogs, doubling the arrays as needed
+        """
+        capacity = len(self.codes['id'])
+        if self.size + count <= capacity:
+            return
+        capacity = max(2 * capacity, self.size + count)
+        for column, codes in self.codes.items():
+            grown = np.zeros(capacity, dtype=codes.dtype)
+            grown[:self.size] = codes[:self.size]
+            self.codes[column] = grown
+
+    def append(self, labels: Labels, count: int = 1):
+        """Appends the labels of count blogs, e.g. every blog of a file
+
+        Args:
+            labels (Labels): Labels of the blogs
+            count (int, optional): Number of blogs. Defaults to 1.
+        """
+        self.reserve(count)
+        end = self.size + count
+        for column in self.COLUMNS:
+            value = getattr(labels, column)
+            self.codes[column][self.size:end] = value if column == 'age' else self.code(column, value)
+        self.size = end
+
+    def extend(self, ids: Sequence, genders: Sequence[str], ages: Sequence[int], zodiacs: Sequence[str]):
+        """Appends the labels of many blogs at once, as in the csv files
+
+        Args:
+            ids, genders, ages, zodiacs: One value per blog, ages not categorized
+        """
+        count = len(ids)
+        self.reserve(count)
+        end = self.size + count
+        ages = np.asarray(ages)
+        if count and ages.min() < 0:
+            raise AttributeError("Age {} is not allowed".format(ages.min()))
+        # same categories as Labels
+        self.codes['age'][self.size:end] = np.searchsorted((19, 29), ages, side='left')
+        for column, values in (('id', ids), ('gender', np.char.lower(np.asarray(genders, dtype=str))),
+                               ('zodiac', zodiacs)):
+            uniques, inverse = np.unique(np.asarray(values), return_inverse=True)
+            codes = np.array([self.code(column, value) for value in uniques.tolist()],
+                             dtype=self.DTYPES[column])
+            self.codes[column][self.size:end] = codes[inverse]
+        self.size = end
+
+    def column(self, name: str) -> np.ndarray:
+        """Codes of a label column, without copying
+
+        Args:
+            name (str): Label column, e.g. gender or bloggerID
+        """
+        return self.codes[self.ALIASES.get(name, name)][:self.size]
+
+    def values(self, name: str) -> np.ndarray:
+        """Values of a label column, e.g. a y vector for train.py
+
+        Args:
+            name (str): Label column, e.g. gender or bloggerID
+        """
+        name = self.ALIASES.get(name, name)
+        if name == 'age':
+            return self.column(name)
+        return np.array(self.tables[name])[self.column(name)]
+
+    def __getitem__(self, key: Union[int, slice, str]) -> Union[Labels, "LabelStore", np.ndarray]:
+        """Labels of a blog, a slice of the store without copying,
+        or the values of a label column, as a DataFrame gives
+        """
+        if isinstance(key, str):
+            return self.values(key)
+        if isinstance(key, slice):
+            view = LabelStore.__new__(LabelStore)
+            view.codes = {column: codes[:self.size][key] for column, codes in self.codes.items()}
+            view.size = len(view.codes['id'])
+            # growing a view copies its arrays, the tables stay shared
+            view.tables = self.tables
+            view.indices = self.indices
+            return view
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("label store index out of range")
+        labels = Labels.__new__(Labels)
+        for column in self.COLUMNS:
+            code = int(self.codes[column][key])
+            setattr(labels, column, code if column == 'age' else self.tables[column][code])
+        return labels
+
+    def __iter__(self) -> Iterator[Labels]:
+        for index in range(self.size):
+            yield self[index]
+
+
 class Preprocessor():
     """
     Stores settings of a preprocessing pipeline
@@ -62,69 +208,362 @@ class Preprocessor():
 
         self.path_to_corpus_directory = path_to_corpus_directory
 
-        self.preprocesses: List[Callable[[List[str]], List[str]]] = []
-        self.tokenizer: Callable[[str], List[str]] = lambda x: x.split()
+        # the fused pipeline, rebuilt on first use after the pipeline changes
+        self.fused: Optional[Callable[[str], List[str]]] = None
+
+        self._preprocesses: Tuple[Callable[[List[str]], List[str]], ...] = ()
+        # str.split rather than a lambda, so that the pipeline can be sent to worker processes
+        self._tokenizer: Callable[[str], List[str]] = str.split
+
+        # vectorized procedures over the whole column of blogs, before tokenization
+        self.column_procedures: List[Callable[[Series], Series]] = []
+        # token by token procedures, fused into one memoized pass after tokenization
+        self._token_mappings: Tuple[Callable[[str], str], ...] = ()
+
+        # memory-map the compiled corpus instead of parsing the csv files
+        self.compiled: bool = False
+        # threads parsing the csv files of blog_stream, and whether files come in directory order
+        self.readers: int = 1
+        self.ordered: bool = True
+
+        # labels of the last run_yield, see dump_labels
+        self.dumped_labels: Optional[LabelStore] = None
+
+    def __getstate__(self):
+        # the fused pipeline is a closure, rebuilt on first use
+        state = self.__dict__.copy()
+        state['fused'] = None
+        return state
+
+    # Setting the procedures discards the fused pipeline. They are tuples, so that
+    # they cannot change in place behind its back.
+    @property
+    def tokenizer(self) -> Callable[[str], List[str]]:
+        return self._tokenizer
+
+    @tokenizer.setter
+    def tokenizer(self, tokenizer: Callable[[str], List[str]]):
+        self._tokenizer = tokenizer
+        self.refresh()
+
+    @property
+    def token_mappings(self) -> Tuple[Callable[[str], str], ...]:
+        return self._token_mappings
+
+    @token_mappings.setter
+    def token_mappings(self, mappings: Sequence[Callable[[str], str]]):
+        self._token_mappings = tuple(mappings)
+        self.refresh()
+
+    @property
+    def preprocesses(self) -> Tuple[Callable[[List[str]], List[str]], ...]:
+        return self._preprocesses
+
+    @preprocesses.setter
+    def preprocesses(self, procedures: Sequence[Callable[[List[str]], List[str]]]):
+        self._preprocesses = tuple(procedures)
+        self.refresh()
+
+    def refresh(self):
+        """Rebuilds the fused pipeline on next use, ex. after changing
+        the settings of the tokenizer object
+        """
+        self.fused = None
 
-        self.temp_labels: TemporaryFile
-        self.labels_queue : Queue[Labels]
+    def blog_stream(self, return_unparsed_labels: bool = False,
+                    files: Optional[Collection[str]] = None) -> Iterator[Union[Tuple[str, Labels], DataFrame]]:
+        """Iterates over the corpus directly from disk. The csv files are parsed by
+        self.readers threads; with self.ordered, files come in directory order,
+        otherwise as soon as they are parsed. Every row of a file shares one Labels.
 
-    def blog_stream(self, return_unparsed_labels: bool = False) -> Iterator[Union[Tuple[str, Labels], DataFrame]]:
-        """Iterates over the corpus directly from disk
+        Args:
+            return_unparsed_labels (bool, optional): Yield whole files as DataFrames. Defaults to False.
+            files (Collection[str], optional): Names of the csv files to read. Defaults to all of them.
         """
-        # Use multithreading queue
-        dataframes: Queue[DataFrame] = Queue(maxsize=5)
-
-        def produce_dataframes():
-            for path in os.listdir(self.path_to_corpus_directory):
-                if not path.endswith(".csv"):
-                    continue
-                dataframe = pd.read_csv(os.path.join(self.path_to_corpus_directory, path),
-                                        names=('ID', 'Gender', 'Age', 'Zodiac', 'Blog'))
-                dataframes.put(dataframe)
-        producer = threading.Thread(
-            target=produce_dataframes, name="csv reader")
-        producer.start()
-
-        while producer.is_alive() or dataframes.qsize() != 0:
-            dataframe = dataframes.get()
-            dataframes.task_done()
+        for dataframe in self.read_dataframes(files):
+            for procedure in self.column_procedures:
+                dataframe['Blog'] = procedure(dataframe['Blog'])
             if return_unparsed_labels:
                 yield dataframe
-            else:
+            elif len(dataframe) > 0:
+                # parsed once per file
+                labels = Labels(dataframe['ID'][0], dataframe['Gender'][0], dataframe['Age'][0], dataframe['Zodiac'][0])
                 for row in dataframe['Blog']:
-                    yield row, Labels(dataframe['ID'][0], dataframe['Gender'][0], dataframe['Age'][0], dataframe['Zodiac'][0])
+                    yield row, labels
 
-    def save(self, directory: str):
-        """Saves the preprocessed corpus to the directory
+    def read_dataframes(self, files: Optional[Collection[str]] = None) -> Iterator[DataFrame]:
+        """Reads the files of the corpus, one DataFrame per blogger file
+
+        Args:
+            files (Collection[str], optional): Names of the csv files to read. Defaults to all of them.
+        """
+        if self.compiled:
+            # memory-mapped, nothing to parse
+            try:
+                from cache import open_corpus
+            except ImportError:
+                from corpus.cache import open_corpus
+            for file, dataframe in open_corpus(self.path_to_corpus_directory).file_frames():
+                if files is not None and file not in files:
+                    continue
+                dataframe.columns = list(COLUMNS)
+                yield dataframe
+            return
+
+        paths = [path for path in os.listdir(self.path_to_corpus_directory)
+                 if path.endswith(".csv") and (files is None or path in files)]
+        readers = max(1, min(self.readers, len(paths)))
+
+        tasks: Queue[Tuple[int, str]] = Queue()
+        for task in enumerate(paths):
+            tasks.put(task)
+        # (index, DataFrame) per file, an exception, or None when a reader is done
+        dataframes: Queue = Queue()
+        # files read but not consumed yet, so that memory stays bounded
+        slots = Semaphore(readers + 4)
+        stop = Event()
+
+        def read():
+            try:
+                while True:
+                    slots.acquire()
+                    if stop.is_set():
+                        break
+                    try:
+                        index, path = tasks.get_nowait()
+                    except Empty:
+                        break
+                    dataframe = pd.read_csv(os.path.join(self.path_to_corpus_directory, path),
+                                            names=COLUMNS)
+                    dataframes.put((index, dataframe))
+            except Exception as error:
+                dataframes.put(error)
+            finally:
+                # end of stream
+                dataframes.put(None)
+        for number in range(readers):
+            threading.Thread(target=read, name="csv reader {}".format(number), daemon=True).start()
+
+        # files read ahead of the next one in order
+        waiting: Dict[int, DataFrame] = {}
+        next_index = 0
+        running = readers
+        try:
+            while running > 0:
+                item = dataframes.get()
+                if item is None:
+                    running -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                index, dataframe = item
+                if not self.ordered:
+                    slots.release()
+                    yield dataframe
+                    continue
+                # files are taken in order, so the next one is always being read
+                waiting[index] = dataframe
+                while next_index in waiting:
+                    slots.release()
+                    yield waiting.pop(next_index)
+                    next_index += 1
+        finally:
+            # wake up the readers, even if the consumer stopped early
+            stop.set()
+            for _ in range(readers):
+                slots.release()
+
+    def save(self, directory: str, tokens: bool = False, jobs: int = 1):
+        """Saves the preprocessed corpus to the directory. Csv files are saved
+        incrementally: only the blogger files that are new or changed since the last save
+        are preprocessed, unless the pipeline itself changed (see update_manifest).
 
         Args:
             directory (str): Folder where to save
+            tokens (bool, optional): Whether to save a token store (see token_store.py)
+                instead of csv files of space-separated tokens. Defaults to False.
+            jobs (int, optional): Number of worker processes, each preprocessing
+                whole blogger files. Defaults to 1, in this process.
+
+        Raises:
+            ValueError: When the corpus is compiled and jobs is more than 1,
+                the workers only read the csv files
+        """
+        if self.compiled and jobs > 1:
+            raise ValueError("A compiled corpus is saved with a single job")
+        if tokens:
+            # a single vocabulary for the whole corpus, always rebuilt
+            import shutil
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            if jobs > 1:
+                self.save_parallel(directory, tokens, jobs)
+            else:
+                self.save_token_store(directory)
+            return
+
+        files, manifest = self.update_manifest(directory)
+
+        if not files:
+            pass
+        elif jobs > 1:
+            self.save_parallel(directory, tokens, jobs, files)
+        else:
+            processed_dataframes : Queue[DataFrame] = Queue()
+
+            def csv_writer():
+                while True:
+                    dataframe = processed_dataframes.get()
+                    write_csv(dataframe, directory)
+                    processed_dataframes.task_done()
+            writer = threading.Thread(target=csv_writer, name="csv writer", daemon=True)
+            writer.start()
+
+            for dataframe in self.blog_stream(True, files):
+                dataframe['Blog'] = dataframe['Blog'].apply(
+                    lambda blog: " ".join(self.preprocess(blog)))
+                processed_dataframes.put(dataframe)
+
+            processed_dataframes.join()
+
+        # recorded last: an interrupted save redoes the files it did not finish
+        write_manifest(directory, manifest)
+
+    def update_manifest(self, directory: str) -> Tuple[List[str], dict]:
+        """Compares the corpus with the manifest of a previous save to the directory.
+        Removes the outputs of the blogger files that changed or are gone, or every
+        output if the pipeline changed.
+
+        Args:
+            directory (str): Folder where the csv files are saved
+
+        Returns:
+            List[str]: Names of the blogger files to preprocess
+            dict: Manifest to record once they are saved
+        """
+        try:
+            from cache import fingerprint
+        except ImportError:
+            from corpus.cache import fingerprint
+
+        pipeline = self.fingerprint()
+        previous = read_manifest(directory)
+        if previous is None or previous.get('version') != MANIFEST_VERSION\
+                or previous.get('pipeline') != pipeline:
+            if previous is not None:
+                print("The pipeline changed, preprocessing the whole corpus again", file=sys.stderr)
+            import shutil
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            previous = {'files': {}}
+
+        current = {name: (size, modified) for name, size, modified in
+                   fingerprint(self.path_to_corpus_directory)}
+        entries = {}
+        removed = 0
+        for name, entry in previous['files'].items():
+            if current.get(name) == (entry['size'], entry['mtime']):
+                entries[name] = entry
+                continue
+            removed += name not in current
+            if entry['output'] is not None:
+                try:
+                    os.remove(os.path.join(directory, entry['output']))
+                except FileNotFoundError:
+                    pass
+        files = [name for name in current if name not in entries]
+
+        # forget the pending files before touching them
+        manifest = {'version': MANIFEST_VERSION, 'pipeline': pipeline, 'files': entries}
+        write_manifest(directory, manifest)
+        print("{} blogger files to preprocess, {} unchanged, {} removed"
+              .format(len(files), len(entries), removed), file=sys.stderr)
+
+        manifest = {'version': MANIFEST_VERSION, 'pipeline': pipeline, 'files': dict(entries)}
+        for name in files:
+            size, modified = current[name]
+            manifest['files'][name] = {'size': size, 'mtime': modified,
+                                       'output': output_name(os.path.join(self.path_to_corpus_directory, name))}
+        return files, manifest
+
+    def fingerprint(self) -> str:
+        """Hashes the configuration of the pipeline: which tokenizer, procedures
+        and mappings, their code and the settings of the objects they are bound to
+
+        Returns:
+            str: Hexadecimal digest, the same as long as the output would be the same
+        """
+        digest = hashlib.sha1()
+        for name, procedures in (("tokenizer", [self.tokenizer]),
+                                 ("column procedures", self.column_procedures),
+                                 ("token mappings", self.token_mappings),
+                                 ("preprocesses", self.preprocesses)):
+            digest.update(name.encode('utf-8'))
+            for procedure in procedures:
+                digest.update(describe(procedure).encode('utf-8'))
+        return digest.hexdigest()
+
+    def save_parallel(self, directory: str, tokens: bool, jobs: int,
+                      files: Optional[List[str]] = None):
+        """Preprocesses the blogger files over a pool of processes,
+        the largest first so that no long file is left running alone at the end.
+        The files are written in the order of the directory, as save_token_store
+        does, so that the token ids do not depend on which worker finishes first.
+
+        Args:
+            directory (str): Existing folder where to save
+            tokens (bool): Whether to save a token store instead of csv files
+            jobs (int): Number of worker processes
+            files (List[str], optional): Names of the csv files to preprocess. Defaults to all of them.
         """
-        import shutil
-        shutil.rmtree(directory)
-        os.makedirs(directory)
-
-        processed_dataframes : Queue[DataFrame] = Queue()
-
-        def csv_writer():
-            while True:
-                dataframe = processed_dataframes.get()
-                dataframe.to_csv(
-                    "{folder}/{ID}.{gender}.{age}.{zodiac}.csv"
-                    .format(folder=directory, ID=dataframe['ID'][0], gender=dataframe['Gender'][0],
-                        age=dataframe['Age'][0], zodiac=dataframe['Zodiac'][0]),
-                    header=False, index=False)
-                processed_dataframes.task_done()
-        writer = threading.Thread(target=csv_writer, name="csv writer", daemon=True)
-        writer.start()
+        if files is None:
+            files = [path for path in os.listdir(self.path_to_corpus_directory) if path.endswith(".csv")]
+        # in the order of read_dataframes
+        paths = [os.path.join(self.path_to_corpus_directory, path)
+                 for path in os.listdir(self.path_to_corpus_directory) if path in files]
+        sizes = {path: os.path.getsize(path) for path in paths}
+
+        writer = None
+        if tokens:
+            try:
+                from token_store import TokenStoreWriter
+            except ImportError:
+                from corpus.token_store import TokenStoreWriter
+            writer = TokenStoreWriter(directory)
+
+        progress = Progress(len(paths))
+        # the pool takes the tasks in submission order
+        with ProcessPoolExecutor(max_workers=jobs, initializer=set_worker_preprocessor,
+                                 initargs=(self,)) as pool:
+            futures = {path: pool.submit(preprocess_file, path, None if tokens else directory)
+                       for path in sorted(paths, key=sizes.__getitem__, reverse=True)}
+            for path in paths:
+                # popped so that the written files are freed
+                dataframe = futures.pop(path).result()
+                if writer is not None:
+                    for id, gender, age, zodiac, blog in dataframe.itertuples(index=False):
+                        writer.add(blog, id, gender, age, zodiac)
+                progress.update(sizes[path])
+        if writer is not None:
+            writer.close()
+        progress.finish()
+
+    def save_token_store(self, directory: str):
+        """Saves the preprocessed corpus as a token store
 
+        Args:
+            directory (str): Existing folder where to save
+        """
+        try:
+            from token_store import TokenStoreWriter
+        except ImportError:
+            from corpus.token_store import TokenStoreWriter
+        writer = TokenStoreWriter(directory)
         for dataframe in self.blog_stream(True):
-            dataframe['Blog'] = dataframe['Blog'].apply(
-                lambda blog: " ".join(self.preprocess(blog)))
-            processed_dataframes.put(dataframe)
+            for id, gender, age, zodiac, blog in dataframe.itertuples(index=False):
+                writer.add(self.preprocess(blog), id, gender, age, zodiac)
+        writer.close()
 
-        processed_dataframes.join()
-        
 
     def preprocess(self, blog: str) -> List[str]:
         """Preprocess a string with the instance's tokenizer
@@ -136,10 +575,50 @@ class Preprocessor():
         Returns:
             List[str]: Preprocessed tokens
         """
-        preprocessed = self.tokenizer(blog)
-        for procedure in self.preprocesses:
-            preprocessed = procedure(preprocessed)
-        return preprocessed
+        if self.fused is None:
+            self.fused = self.fuse()
+        return self.fused(blog)
+
+    def fuse(self) -> Callable[[str], List[str]]:
+        """Compiles the pipeline into a single function. The token mappings
+        run in one pass per blog, and their result for each token type is memoized.
+
+        Returns:
+            Callable[[str], List[str]]: Same output as running the procedures in sequence
+        """
+        tokenizer = self.tokenizer
+        mappings = tuple(self.token_mappings)
+        procedures = tuple(self.preprocesses)
+
+        if not mappings:
+            map_tokens = None
+        else:
+            # token type -> mapped token, cleared when full
+            memo: Dict[str, str] = {}
+            lookup = memo.get
+
+            def map_tokens(tokens: List[str]) -> List[str]:
+                mapped = [lookup(token) for token in tokens]
+                if None not in mapped:
+                    return mapped
+                for index, token in enumerate(tokens):
+                    if mapped[index] is None:
+                        value = token
+                        for mapping in mappings:
+                            value = mapping(value)
+                        if len(memo) >= TOKEN_CACHE_SIZE:
+                            memo.clear()
+                        memo[token] = mapped[index] = value
+                return mapped
+
+        def fused(blog: str) -> List[str]:
+            preprocessed = tokenizer(blog)
+            if map_tokens is not None:
+                preprocessed = map_tokens(preprocessed)
+            for procedure in procedures:
+                preprocessed = procedure(preprocessed)
+            return preprocessed
+        return fused
 
     def run(self) -> List[Tuple[List[str], Labels]]:
         """
@@ -152,7 +631,7 @@ class Preprocessor():
 
     def run_yield(self, no_dumping=True) -> Iterator[Tuple[List[str], Labels]]:
         """Runs the preprocessor on the corpus and yields data point by data point.
-        Optionally dumps the processed labels to a tempfile for future use.
+        Optionally dumps the processed labels to a label store for future use.
 
         Yields:
             Iterator[Tuple[List[str], Labels]]: Iterator over the data points
@@ -161,13 +640,10 @@ class Preprocessor():
             for blog, blogger in self.blog_stream():
                 yield self.preprocess(blog), blogger
         else:
-            finished_event = self.new_dump_labels()
+            self.new_dump_labels()
             for blog, blogger in self.blog_stream():
                 self.dump_labels(blogger)
                 yield self.preprocess(blog), blogger
-            finished_event.set()
-            self.labels_queue.join()
-            self.__dumped_labels = True
 
     def run_yield_slice(self, slice_size=100) -> Iterator[List[Tuple[List[str], Labels]]]:
         """Runs the preprocessor on the corpus and yields slice by slice.
@@ -192,88 +668,278 @@ class Preprocessor():
         if len(buffer) > 0:
             yield buffer
 
-    def new_dump_labels(self) -> Event:
+    def new_dump_labels(self) -> LabelStore:
         """Prepares a new dump for labels
         """
-        self.temp_labels = TemporaryFile()
-        self.labels_queue = Queue()
-
-        def labels_dumper(stop_event: Event):
-            while self.labels_queue.qsize() != 0 or not stop_event.is_set():
-                labels = self.labels_queue.get()
-                dump(labels, self.temp_labels)
-                self.labels_queue.task_done()
-        finished_queuing = Event()
-        threading.Thread(target=labels_dumper, kwargs={"stop_event":finished_queuing}, daemon=True).start()
-        return finished_queuing
-    
+        self.dumped_labels = LabelStore()
+        return self.dumped_labels
+
     def dump_labels(self, labels: Labels):
-        """Dumps the given labels, aynchronously
+        """Dumps the given labels
         """
-        self.labels_queue.put(labels)
+        self.dumped_labels.append(labels)
 
     def load_temp_labels(self) -> Iterator[Labels]:
-        """Opens the temporary file of labels that was previously dumped
+        """Iterates over the labels that were previously dumped
         by self.run_yield
 
         Yields:
             Iterator[Labels]: Iterator of labels
         """
-        if self.__dumped_labels is False:
+        if self.dumped_labels is None:
             raise Exception("No labels has been dumped yet")
-        self.temp_labels.seek(0) # a low-level requirement
-        while True:
-            try:
-                yield load(self.temp_labels)
-            except EOFError:
-                break
-        
-def main():
-    parser = argparse.ArgumentParser("Runs the full preprocessing pipeline")
+        return iter(self.dumped_labels)
 
-    parser.add_argument("corpus", help="Where the corpus is located")
+def read_manifest(directory: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
 
-    parser.add_argument("save", metavar="save-location", help="Where to save")
+def write_manifest(directory: str, manifest: dict):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w", encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(path + ".tmp", path)
 
-    args = parser.parse_args()
+def output_name(path: str) -> Optional[str]:
+    """Name of the preprocessed csv file of a blogger file, from its first row
+
+    Args:
+        path (str): Csv file of the corpus
+
+    Returns:
+        Optional[str]: {ID}.{gender}.{age}.{zodiac}.csv, None for an empty file
+    """
+    dataframe = pd.read_csv(path, names=COLUMNS, nrows=1)
+    if len(dataframe) == 0:
+        return None
+    return "{ID}.{gender}.{age}.{zodiac}.csv".format(
+        ID=dataframe['ID'][0], gender=dataframe['Gender'][0],
+        age=dataframe['Age'][0], zodiac=dataframe['Zodiac'][0])
+
+def code_digest(code) -> str:
+    """Hashes a code object with its constants, nested functions included
+    """
+    digest = hashlib.sha1(code.co_code)
+    for constant in code.co_consts:
+        if hasattr(constant, 'co_code'):
+            digest.update(code_digest(constant).encode('utf-8'))
+        else:
+            digest.update(repr(constant).encode('utf-8'))
+    return digest.hexdigest()
+
+def describe(procedure: Callable) -> str:
+    """Describes a procedure of the pipeline for Preprocessor.fingerprint:
+    its name, its code and the settings of the object of a bound method
+    """
+    function = getattr(procedure, '__func__', procedure)
+    parts = [getattr(function, '__module__', None) or '',
+             getattr(function, '__qualname__', None) or repr(function)]
+    code = getattr(function, '__code__', None)
+    if code is not None:
+        parts.append(code_digest(code))
+    owner = getattr(procedure, '__self__', None)
+    if owner is not None and hasattr(owner, '__dict__') and not isinstance(owner, type):
+        # e.g. the settings of a tokenizer, without its memoized tokens
+        state = owner.__getstate__() if hasattr(owner, '__getstate__') else vars(owner)
+        if isinstance(state, dict):
+            parts.append(repr(sorted(state.items())))
+    return "|".join(parts)
+
+def write_csv(dataframe: DataFrame, directory: str):
+    """Writes a preprocessed blogger file, named after its labels
+    """
+    dataframe.to_csv(
+        "{folder}/{ID}.{gender}.{age}.{zodiac}.csv"
+        .format(folder=directory, ID=dataframe['ID'][0], gender=dataframe['Gender'][0],
+            age=dataframe['Age'][0], zodiac=dataframe['Zodiac'][0]),
+        header=False, index=False)
+
+# Preprocessor of the worker processes of Preprocessor.save, sent once when the worker starts
+worker_preprocessor: Optional[Preprocessor] = None
+
+def set_worker_preprocessor(preprocessor: Preprocessor):
+    global worker_preprocessor
+    worker_preprocessor = preprocessor
 
-    preprocessor = Preprocessor(args.corpus)
+def preprocess_file(path: str, directory: Optional[str]) -> Optional[DataFrame]:
+    """Preprocesses a blogger file in a worker process
+
+    Args:
+        path (str): Csv file of the corpus
+        directory (Optional[str]): Where to write the preprocessed csv file,
+            or None to send back the tokens instead
+
+    Returns:
+        Optional[DataFrame]: Labels and lists of tokens, when not written
+    """
+    dataframe = pd.read_csv(path, names=COLUMNS)
+    for procedure in worker_preprocessor.column_procedures:
+        dataframe['Blog'] = procedure(dataframe['Blog'])
+    preprocessed = [worker_preprocessor.preprocess(blog) for blog in dataframe['Blog']]
+    if directory is None:
+        dataframe['Blog'] = preprocessed
+        return dataframe
+    dataframe['Blog'] = [" ".join(tokens) for tokens in preprocessed]
+    write_csv(dataframe, directory)
+    return None
+
+class Progress():
+    """Prints the progress and throughput of a run over files to stderr
+    """
+
+    # seconds between two reports
+    INTERVAL = 0.5
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.bytes = 0
+        self.start = self.reported = time.perf_counter()
+
+    def update(self, size: int):
+        self.done += 1
+        self.bytes += size
+        now = time.perf_counter()
+        if now - self.reported < self.INTERVAL and self.done < self.total:
+            return
+        self.reported = now
+        elapsed = max(now - self.start, 1e-9)
+        print("\r{}/{} files, {:.1f} files/s, {:.2f} MB/s".format(
+            self.done, self.total, self.done / elapsed, self.bytes / 1024 ** 2 / elapsed),
+            end='', file=sys.stderr, flush=True)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        print("\nPreprocessed {} files ({:.1f} MB) in {:.1f}s".format(
+            self.done, self.bytes / 1024 ** 2, elapsed), file=sys.stderr)
+
+def map_number(word: str) -> str:
+    return 'NUM' if word.isnumeric() else word
+
+def map_nonascii(word: str) -> str:
+    return 'NONASCII' if not word.isascii() else word
+
+def benchmark(preprocessor: Preprocessor, sample: int):
+    """Times the pipeline on the first blogs of the corpus,
+    running the token mappings stage by stage, then fused
+    """
+    blogs: List[str] = []
+    for blog, _ in preprocessor.blog_stream():
+        blogs.append(blog)
+        if len(blogs) == sample:
+            break
+    megabytes = sum(len(blog.encode('utf-8')) for blog in blogs) / 1024 ** 2
+
+    def staged(blog: str) -> List[str]:
+        # one new list per stage per blog, as before fusing
+        preprocessed = preprocessor.tokenizer(blog)
+        for mapping in preprocessor.token_mappings:
+            preprocessed = list(map(mapping, preprocessed))
+        for procedure in preprocessor.preprocesses:
+            preprocessed = procedure(preprocessed)
+        return preprocessed
+
+    # tokenize once beforehand so that both runs see a warm tokenizer
+    for blog in blogs:
+        preprocessor.tokenizer(blog)
+
+    # tokenization alone is the floor of both pipelines
+    results = {}
+    for name, pipeline in (("tokenize only", preprocessor.tokenizer), ("staged", staged),
+                           ("fused", preprocessor.fuse())):
+        start = time.perf_counter()
+        results[name] = [pipeline(blog) for blog in blogs]
+        elapsed = time.perf_counter() - start
+        print("{}: {} blogs, {:.2f}s, {:.2f} MB/s".format(name, len(blogs), elapsed, megabytes / elapsed))
+    if results["staged"] != results["fused"]:
+        raise Exception("The fused pipeline gives different tokens")
+
+def project_preprocessor(path_to_corpus_directory: str) -> Preprocessor:
+    """The preprocessing pipeline of the project, which makes the saved corpora
+    and token stores. vectorizer.py --tokens analyzes raw texts with it.
+
+    Args:
+        path_to_corpus_directory (str): Directory of the corpus
+
+    Returns:
+        Preprocessor: The pipeline
+    """
+    preprocessor = Preprocessor(path_to_corpus_directory)
     # choose a tokenizer, by default it is python's split
-    from nltk.tokenize import TweetTokenizer
-    tweet = TweetTokenizer(preserve_case=False, reduce_len=True)
+    # same tokens as nltk's TweetTokenizer, only faster
+    try:
+        from tokenizer import FastTweetTokenizer
+    except ImportError:
+        from corpus.tokenizer import FastTweetTokenizer
+    tweet = FastTweetTokenizer(preserve_case=False, reduce_len=True)
     preprocessor.tokenizer = tweet.tokenize  # a function
 
-    # append as many non-tokenizing preprocesses as needed, e.g. lowercase mapping
+    # add as many token by token mappings as needed, e.g. lowercase mapping
+    # fn( str ) -> str, fused and memoized per token type
+    # other non-tokenizing preprocesses go in preprocessor.preprocesses
     # fn( List[str] ) -> List[str]
 
-    def map_numbers(words: List[str]):
-        for word in words:
-            yield 'NUM' if word.isnumeric() else word
-
-    def map_nonascii(words: List[str]):
-        for word in words:
-            yield 'NONASCII' if not word.isascii() else word
-
     # stemming is too weird
     # from nltk.stem import PorterStemmer
     # stemmer = PorterStemmer()
 
-    preprocessor.preprocesses.extend([
+    preprocessor.token_mappings += (
         # lowercase is handled by the tweet tokenizer
         # numbers
-        lambda x: list(map_numbers(x)),
+        map_number,
         # nonascii
-        lambda x: list(map_nonascii(x))
+        map_nonascii,
         # stemming
-        #lambda x: [stemmer.stem(word) for word in x]
-    ])
-
-    # run the preprocessing pipeline
-    #preprocessor.save(args.save)
-    for blog, blogger in preprocessor.run_yield(no_dumping=False):
-        print(len(blog), blogger, sep='\t')
-    for dumped in preprocessor.load_temp_labels():
-        print(dumped)
+        #stemmer.stem
+    )
+    return preprocessor
+
+def main():
+    parser = argparse.ArgumentParser("Runs the full preprocessing pipeline")
+
+    parser.add_argument("corpus", help="Where the corpus is located")
+
+    parser.add_argument("save", metavar="save-location", help="Where to save")
+
+    parser.add_argument("--tokens", help="Save a token store of the preprocessed corpus "
+                        "(see token_store.py), for the --tokens mode of vectorizer.py, train.py and predict.py",
+                        const=True, action='store_const', default=False)
+
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Save with this many worker processes, each preprocessing whole "
+                        "blogger files (default: %(default)s)")
+
+    parser.add_argument("--readers", type=int, default=1,
+                        help="Threads parsing the csv files (default: %(default)s)")
+
+    parser.add_argument("--benchmark", metavar="blogs", type=int,
+                        help="Only time the pipeline on this many blogs, staged versus fused")
+
+    parser.add_argument("--print-lengths", const=True, action='store_const', default=False,
+                        help="Only print the number of tokens and the labels of each blog, "
+                        "instead of saving")
+
+    args = parser.parse_args()
+
+    preprocessor = project_preprocessor(args.corpus)
+    preprocessor.readers = args.readers
+
+    if args.benchmark is not None:
+        benchmark(preprocessor, args.benchmark)
+        return
+
+    if args.print_lengths:
+        for blog, blogger in preprocessor.run_yield(no_dumping=False):
+            print(len(blog), blogger, sep='\t')
+        for dumped in preprocessor.load_temp_labels():
+            print(dumped)
+        return
+
+    # run the preprocessing pipeline, the same output whatever the number of jobs
+    preprocessor.save(args.save, tokens=args.tokens, jobs=args.jobs)
 
 
 if __name__ == "__main__":
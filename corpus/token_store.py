@@ -0,0 +1,140 @@
+"""
+Token store
+
+Compact on-disk format of a tokenized corpus: a vocabulary table, a flat
+array of token IDs, per-document offsets into that array and the label
+columns. Everything but the vocabulary is memory-mapped on read, so that
+a term-count matrix can be built without any string tokenization.
+"""
+
+import json
+import os
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+from scipy.sparse import csr_matrix
+
+VOCABULARY = "vocabulary.json"
+TOKENS = "tokens.bin"
+OFFSETS = "offsets.npy"
+LABEL_COLUMNS = ('bloggerID', 'gender', 'age', 'zodiac')
+TOKEN_DTYPE = np.int32
+
+
+class TokenStoreWriter():
+    """Appends tokenized documents to a new token store
+    """
+
+    def __init__(self, directory: str):
+        """Creates an empty token store in the directory
+
+        Args:
+            directory (str): Folder of the token store, must exist
+        """
+        self.directory = directory
+        self.vocabulary: Dict[str, int] = {}
+        self.offsets: List[int] = [0]
+        self.labels: Dict[str, list] = {column: [] for column in LABEL_COLUMNS}
+        self.tokens_file = open(os.path.join(directory, TOKENS), "wb")
+
+    def add(self, tokens: List[str], id: str, gender: str, age: int, zodiac: str):
+        """Appends a document and its labels
+
+        Args:
+            tokens (List[str]): Preprocessed tokens of the blog
+            id, gender, age, zodiac: Labels of the blog, as in the csv files
+        """
+        vocabulary = self.vocabulary
+        ids = [vocabulary.setdefault(token, len(vocabulary)) for token in tokens]
+        np.asarray(ids, dtype=TOKEN_DTYPE).tofile(self.tokens_file)
+        self.offsets.append(self.offsets[-1] + len(ids))
+        for column, value in zip(LABEL_COLUMNS, (id, gender, age, zodiac)):
+            self.labels[column].append(value)
+
+    def close(self):
+        """Writes the vocabulary, the offsets and the labels
+        """
+        self.tokens_file.close()
+        with open(os.path.join(self.directory, VOCABULARY), "w", encoding='utf-8') as file:
+            # ids are insertion order
+            json.dump(list(self.vocabulary), file, ensure_ascii=False)
+        np.save(os.path.join(self.directory, OFFSETS), np.array(self.offsets, dtype=np.int64))
+        for column in LABEL_COLUMNS:
+            values = np.array(self.labels[column], dtype=np.int16 if column == 'age' else str)
+            np.save(os.path.join(self.directory, "{}.npy".format(column)), values)
+
+
+class TokenStore():
+    """Read-only, memory-mapped token store
+    """
+
+    def __init__(self, directory: str):
+        """Opens the token store of the directory
+
+        Args:
+            directory (str): Folder of the token store
+        """
+        self.directory = directory
+        with open(os.path.join(directory, VOCABULARY), encoding='utf-8') as file:
+            self.vocabulary: List[str] = json.load(file)
+        self.offsets: np.ndarray = np.load(os.path.join(directory, OFFSETS), mmap_mode='r')
+
+        # memmap refuses empty files
+        path = os.path.join(directory, TOKENS)
+        if os.path.getsize(path) == 0:
+            self.tokens = np.zeros(0, dtype=TOKEN_DTYPE)
+        else:
+            self.tokens = np.memmap(path, dtype=TOKEN_DTYPE, mode='r')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def labels(self, column: str) -> np.ndarray:
+        """Label column, as in the csv files (ages are not categorized)
+        """
+        return np.load(os.path.join(self.directory, "{}.npy".format(column)), mmap_mode='r')
+
+    def document(self, index: int) -> List[str]:
+        """Tokens of a document, for inspection
+        """
+        return [self.vocabulary[token] for token in
+                self.tokens[self.offsets[index]:self.offsets[index + 1]]]
+
+    def documents(self) -> Iterator[np.ndarray]:
+        """Iterates over the token IDs of every document
+        """
+        for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+            yield self.tokens[start:end]
+
+    def counts(self, columns: Optional[np.ndarray] = None, width: Optional[int] = None) -> csr_matrix:
+        """Term-count matrix of the corpus, one row per document
+
+        Args:
+            columns (np.ndarray, optional): Column of each token ID, -1 to drop the token.
+                Defaults to the token IDs themselves.
+            width (int, optional): Number of columns. Defaults to the vocabulary size.
+
+        Returns:
+            csr_matrix: Counts with sorted indices, as CountVectorizer.transform gives
+        """
+        # copies: the matrix sorts its indices in place
+        if columns is None:
+            indices = np.array(self.tokens)
+            indptr = np.array(self.offsets)
+            width = len(self.vocabulary)
+        else:
+            mapped = columns[self.tokens]
+            kept = mapped >= 0
+            indices = mapped[kept]
+            # documents lose the tokens that were dropped
+            kept_before = np.concatenate(([0], np.cumsum(kept, dtype=np.int64)))
+            indptr = kept_before[np.asarray(self.offsets)]
+        counts = csr_matrix((np.ones(len(indices), dtype=np.int64), indices, indptr),
+                            shape=(len(self), width))
+        counts.sum_duplicates()
+        return counts
+
+    def document_frequencies(self) -> np.ndarray:
+        """Number of documents containing each token ID
+        """
+        counts = self.counts()
+        return np.bincount(counts.indices, minlength=len(self.vocabulary))
@@ -1,18 +1,42 @@
 # Produces a classification report of the predictions
 import argparse
 import os
-from pickle import load
 from sklearn.metrics import classification_report
-from sklearn.metrics import confusion_matrix
+from predictions import confusion, expand
+from registry import DEFAULT_PATH, Registry
 
 def get_args():
     parser = argparse.ArgumentParser(description="Evaluates the performance of given predictions. Results are printed to stdout")
 
-    parser.add_argument("predictions", help="File produced by predict.py")
+    parser.add_argument("predictions", nargs="+", help="File produced by predict.py, "
+        "or several files whose predictions are evaluated together, ex. shards of the test set")
     parser.add_argument("--plot", help="If defined, the confusion matrix is saved with the given name")
 
+    parser.add_argument("--registry", help="Run registry recording the metrics, for examine.py "
+        "(default: %(default)s)", default=DEFAULT_PATH)
+    parser.add_argument("--no-registry", help="Do not record the run", const=True, action='store_const', default=False)
+    parser.add_argument("--name", help="Name of the run in the registry, ex. gender-logistic_C20-tfidf "
+        "(default: the name of the first predictions file)")
+    parser.add_argument("--fit-seconds", help="Training time to record", type=float)
+    parser.add_argument("--predict-seconds", help="Prediction time to record", type=float)
+
     return parser.parse_args()
 
+def report(labels, conf_matrix, output_dict: bool = False):
+    """Classification report of a confusion matrix, as classification_report gives it
+    for the predictions behind the matrix
+    """
+    # the report only depends on the confusion matrix, so one pair of codes per blog rebuilds it
+    truth, predicted = expand(conf_matrix)
+    return classification_report(truth, predicted, labels=range(len(labels)),
+                                 target_names=[str(label) for label in labels], output_dict=output_dict)
+
+def record(path: str, name: str, labels, conf_matrix, **details):
+    """Records the metrics of a run in the registry, see registry.py
+    """
+    with Registry(path) as registry:
+        registry.record(name, report(labels, conf_matrix, output_dict=True), **details)
+
 def plot_confusion(conf_matrix, file_name: str):
     import matplotlib.pyplot as plt
     fig, ax = plt.subplots(figsize=(5, 5))
@@ -34,13 +58,15 @@ def plot_confusion(conf_matrix, file_name: str):
 def main():
     args = get_args()
 
-    # Open the predictions
-    file = load(open(args.predictions, 'rb'))
+    # Add up the confusion matrix of each file
+    labels, conf_matrix = confusion(args.predictions)
 
-    truth, predicted = file
-    print(classification_report(truth, predicted))
-    conf_matrix = confusion_matrix(truth, predicted)
+    print(report(labels, conf_matrix))
     print(conf_matrix)
+    if not args.no_registry:
+        name = args.name or os.path.splitext(os.path.basename(args.predictions[0]))[0]
+        record(args.registry, name, labels, conf_matrix, predictions=" ".join(args.predictions),
+               fit_seconds=args.fit_seconds, predict_seconds=args.predict_seconds)
     if args.plot is not None:
         plot_confusion(conf_matrix, args.plot)
 
@@ -1,42 +1,73 @@
 import argparse
 import os
-from typing import List, Tuple
+from typing import Optional
 import pandas as pd
+from registry import DEFAULT_PATH, METRICS, Registry, parse_log
 
 def get_args():
-    parser = argparse.ArgumentParser(description="Finds the best classifier of each metric")
+    parser = argparse.ArgumentParser(description="Finds the best classifier of each metric, "
+                                     "from the run registry written by evaluate.py")
 
-    parser.add_argument("reports", help="Location of the reports")
+    parser.add_argument("reports", nargs='?', help="Location of .log reports to add to the registry first, "
+                        "for runs evaluated before it")
+
+    parser.add_argument("--registry", help="Run registry (default: %(default)s)", default=DEFAULT_PATH)
+    parser.add_argument("--metric", help="Metric to rank by (default: %(default)s)", choices=METRICS,
+                        default="accuracy")
+    parser.add_argument("--label", help="Only runs of this label, ex. gender")
+    parser.add_argument("--model", help="Only runs of this model kind, SQL LIKE patterns allowed, ex. logistic%%")
+    parser.add_argument("--vectorizer", help="Only runs of this vectorizer kind, SQL LIKE patterns allowed")
+    parser.add_argument("--top", help="Number of runs printed (default: %(default)s)", type=int, default=10)
+    parser.add_argument("--classes", help="Also print the metrics of each class of the best run",
+                        const=True, action='store_const', default=False)
 
     return parser.parse_args()
 
-def main():
-    args = get_args()
+def import_reports(registry: Registry, reports: str) -> int:
+    """Adds the .log reports missing from the registry, named after their file
+    """
+    added = 0
+    for log in sorted(os.listdir(reports)):
+        if not log.endswith(".log") or registry.has(log[:-len(".log")]):
+            continue
+        report = parse_log(os.path.join(reports, log))
+        if "accuracy" in report:
+            registry.record(log[:-len(".log")], report)
+            added += 1
+    return added
 
-    accuracies : List[Tuple[float, str]] = []
-    f1s : List[Tuple[float, str]] = []
+def ranking(registry: Registry, metric: str, column: str, label: Optional[str],
+            model: Optional[str], vectorizer: Optional[str]) -> pd.DataFrame:
+    # as read from the .log reports before, with their two digits
+    runs = registry.best(metric, label, model, vectorizer)
+    return pd.DataFrame([(round(run[metric], 2), run["name"] + ".log") for run in runs],
+                        columns=[column, "Classifier"])
 
-    for log in os.listdir(args.reports):
-        if not log.endswith(".log"):
-            continue
+def main():
+    args = get_args()
 
-        for line in open(os.path.join(args.reports, log), "r"):
-            line = line.split()
-            # get accuracy
-            if "accuracy" in line:
-                accuracies.append((float(line[1]), log))
-            # get macro average of f1-scores
-            elif "macro" in line:
-                f1s.append((float(line[4]), log))
+    with Registry(args.registry) as registry:
+        if args.reports is not None:
+            added = import_reports(registry, args.reports)
+            if added:
+                print("Added {} reports of {} to {}".format(added, args.reports, args.registry))
 
-    accuracies.sort(reverse=True, key=lambda x: x[0])
-    f1s.sort(reverse=True, key=lambda x: x[0])
+        best = registry.best(args.metric, args.label, args.model, args.vectorizer, args.top)
+        columns = ["name", "label", "model", "vectorizer", "accuracy", "macro_f1", "weighted_f1",
+                   "fit_seconds", "predict_seconds"]
+        print(pd.DataFrame([tuple(run[column] for column in columns) for run in best], columns=columns)
+              .to_markdown(index=False, floatfmt=".4f"))
+        if args.classes and best:
+            print()
+            classes = [tuple(row)[1:] for row in registry.classes(best[0]["id"])]
+            print(pd.DataFrame(classes, columns=["class", "precision", "recall", "f1", "support"])
+                  .to_markdown(index=False, floatfmt=".4f"))
 
-    df_accuracies = pd.DataFrame(accuracies, columns=["Accuracy", "Classifier"])
-    df_f1s = pd.DataFrame(f1s, columns=["f1", "Classifier"])
+        df_accuracies = ranking(registry, "accuracy", "Accuracy", args.label, args.model, args.vectorizer)
+        df_f1s = ranking(registry, "macro_f1", "f1", args.label, args.model, args.vectorizer)
 
     df_accuracies.to_markdown(open("accuracies.md", "w"))
     df_f1s.to_markdown(open("f1s.md", "w"))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
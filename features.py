@@ -0,0 +1,205 @@
+# Feature matrices of the corpus
+# Persistent cache of transformed corpora, keyed by a hash of the pickled vectorizer
+# and a fingerprint of the corpus directory, so that only the first label of
+# learn_all.sh pays for tokenization; TF-IDF straight from token stores
+import hashlib
+import json
+import os
+import sys
+from typing import Optional, Sequence, Tuple
+import numpy as np
+import scipy.sparse
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from compact import load_vectorizer
+from corpus.cache import fingerprint
+from corpus.preprocessing import LabelStore
+from corpus.token_store import TokenStore
+
+DEFAULT_DIRECTORY = os.path.join("data", "features")
+DEFAULT_SIZE = 4096  # MB
+
+
+def file_hash(path: str) -> str:
+    """Hashes the content of a file, e.g. a pickled vectorizer
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(vectorizer: str, corpus: str) -> str:
+    """Builds the cache key of a corpus transformed by a vectorizer
+
+    Args:
+        vectorizer (str): Vectorizer file
+        corpus (str): Directory of the blog csv corpus
+
+    Returns:
+        str: Hexadecimal key
+    """
+    digest = hashlib.sha1()
+    digest.update(file_hash(vectorizer).encode('utf-8'))
+    digest.update(json.dumps(fingerprint(corpus)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FeatureCache():
+    """Directory of sparse feature matrices saved as .npz, evicted by size
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, max_size: int = DEFAULT_SIZE):
+        """Opens a feature cache
+
+        Args:
+            directory (str, optional): Where the matrices are stored. Defaults to data/features.
+            max_size (int, optional): Size of the cache in MB. Defaults to 4096.
+        """
+        self.directory = directory
+        self.max_bytes = max_size * 1024 ** 2
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, "{}.npz".format(key))
+
+    def load(self, key: str) -> Optional[csr_matrix]:
+        """Loads the matrix stored under the key, if any
+
+        Args:
+            key (str): Cache key, see cache_key
+
+        Returns:
+            Optional[csr_matrix]: The matrix, or None on a cache miss
+        """
+        path = self.path(key)
+        try:
+            matrix = scipy.sparse.load_npz(path)
+        except (OSError, ValueError):
+            return None
+        # mark as recently used for the eviction
+        os.utime(path)
+        print("Reusing cached features {}".format(path), file=sys.stderr)
+        return matrix
+
+    def save(self, key: str, matrix: csr_matrix):
+        """Stores the matrix under the key, then evicts the least recently used entries
+
+        Args:
+            key (str): Cache key, see cache_key
+            matrix (csr_matrix): Transformed corpus
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # write then rename so that concurrent runs never read a partial file
+        temporary = os.path.join(self.directory, "{}.{}.tmp.npz".format(key, os.getpid()))
+        scipy.sparse.save_npz(temporary, matrix, compressed=False)
+        os.replace(temporary, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used matrices until the cache fits in its size
+        """
+        entries = []
+        for file in os.listdir(self.directory):
+            if not file.endswith(".npz") or file.endswith(".tmp.npz"):
+                continue
+            stat = os.stat(os.path.join(self.directory, file))
+            entries.append((stat.st_mtime, stat.st_size, file))
+        entries.sort(reverse=True)
+
+        if not entries:
+            return
+        # always keep the most recent entry
+        total = entries[0][1]
+        for _, size, file in entries[1:]:
+            total += size
+            if total > self.max_bytes:
+                os.remove(os.path.join(self.directory, file))
+
+
+def assign_vocabulary(vectorizer: TfidfVectorizer, terms: Sequence[str], df: np.ndarray,
+                      n_samples: int) -> TfidfVectorizer:
+    """Sets the fitted state of the vectorizer from document frequencies,
+    with the same feature order and idf formula as TfidfVectorizer.fit
+
+    Args:
+        vectorizer (TfidfVectorizer): Vectorizer to fit
+        terms (Sequence[str]): Terms of the vocabulary, in any order
+        df (np.ndarray): Number of documents containing each term
+        n_samples (int): Number of documents
+
+    Returns:
+        TfidfVectorizer: The fitted vectorizer
+    """
+    if len(terms) == 0:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+    order = sorted(range(len(terms)), key=terms.__getitem__)
+    df = np.asarray(df, dtype=np.float64)[order]
+    if vectorizer.smooth_idf:
+        df += 1
+        n_samples += 1
+
+    vectorizer.vocabulary_ = {terms[index]: feature for feature, index in enumerate(order)}
+    vectorizer.fixed_vocabulary_ = False
+    vectorizer.stop_words_ = set()
+    vectorizer.idf_ = np.log(n_samples / df) + 1
+    return vectorizer
+
+
+def fit_tokens(vectorizer: TfidfVectorizer, store: TokenStore) -> TfidfVectorizer:
+    """Fits the vectorizer on a token store, without tokenizing
+
+    Args:
+        vectorizer (TfidfVectorizer): Vectorizer to fit
+        store (TokenStore): Preprocessed corpus
+
+    Returns:
+        TfidfVectorizer: The fitted vectorizer
+    """
+    df = store.document_frequencies()
+    present = np.flatnonzero(df)
+    return assign_vocabulary(vectorizer, [store.vocabulary[token] for token in present],
+                             df[present], len(store))
+
+
+def transform_tokens(vectorizer: TfidfVectorizer, store: TokenStore) -> csr_matrix:
+    """Builds the TF-IDF matrix of a token store, without tokenizing
+
+    Args:
+        vectorizer (TfidfVectorizer): Fitted vectorizer
+        store (TokenStore): Preprocessed corpus
+
+    Returns:
+        csr_matrix: The matrix vectorizer.transform would give on the same tokens
+    """
+    vocabulary = vectorizer.vocabulary_
+    if hasattr(vectorizer, "lookup"):
+        # CompactVectorizer, see compact.py
+        columns = vectorizer.lookup(list(store.vocabulary))
+    else:
+        columns = np.array([vocabulary.get(token, -1) for token in store.vocabulary], dtype=np.int64)
+    X = store.counts(columns, len(vocabulary)).astype(np.float64)
+    if vectorizer.use_idf:
+        X.data *= vectorizer.idf_[X.indices]
+    if vectorizer.norm is not None:
+        X = normalize(X, norm=vectorizer.norm, copy=False)
+    return X
+
+
+def load_token_store(directory: str, vectorizer: str) -> Tuple[csr_matrix, LabelStore]:
+    """Features and labels of a token store, built without tokenizing
+
+    Args:
+        directory (str): Folder of the token store
+        vectorizer (str): Vectorizer file
+
+    Returns:
+        csr_matrix: TF-IDF matrix
+        LabelStore: Labels, with categorized ages; store[label] is a y vector
+    """
+    store = TokenStore(directory)
+    X = transform_tokens(load_vectorizer(vectorizer), store)
+    labels = LabelStore(len(store))
+    labels.extend(*(store.labels(column) for column in ('bloggerID', 'gender', 'age', 'zodiac')))
+    return X, labels
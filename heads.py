@@ -0,0 +1,138 @@
+# Combined predictor of the age, gender and zodiac linear models
+# The coefficients of the three models are stacked into one matrix, so that
+# the labels of a feature matrix are scored with a single sparse product
+import argparse
+import os
+from pickle import dump, load
+import sys
+from typing import Dict, List, Tuple
+import numpy as np
+from scipy.sparse import issparse
+from sklearn.utils.extmath import safe_sparse_dot
+
+LABELS = ("age", "gender", "zodiac")
+
+
+def model_path(label: str, model: str, vectorizer: str) -> str:
+    return f"data/models/{label}-{model}-{vectorizer}.model"
+
+def combined_path(model: str, vectorizer: str) -> str:
+    return f"data/models/combined-{model}-{vectorizer}.model"
+
+
+class MultiHeadPredictor():
+    """Linear models of several labels, scored together
+    """
+
+    def __init__(self, models: Dict[str, object]):
+        """Stacks the coefficients and intercepts of fitted linear classifiers
+
+        Args:
+            models (Dict[str, object]): Model of each label, e.g. LogisticRegression or SGDClassifier
+        """
+        coefs = []
+        intercepts = []
+        # label, first and last score column, classes
+        self.heads: List[Tuple[str, int, int, np.ndarray]] = []
+        start = 0
+        for label, model in models.items():
+            if not hasattr(model, "coef_"):
+                raise TypeError("{} model is not linear: {}".format(label, type(model).__name__))
+            coef = model.coef_.toarray() if issparse(model.coef_) else np.asarray(model.coef_)
+            coefs.append(coef)
+            intercepts.append(np.broadcast_to(model.intercept_, coef.shape[0]))
+            self.heads.append((label, start, start + coef.shape[0], model.classes_))
+            start += coef.shape[0]
+        self.coef = np.vstack(coefs)
+        self.intercept = np.concatenate(intercepts)
+
+    def decision_function(self, X) -> np.ndarray:
+        """Scores of every head, side by side
+        """
+        return safe_sparse_dot(X, self.coef.T, dense_output=True) + self.intercept
+
+    def predict(self, X) -> Dict[str, np.ndarray]:
+        """Predicts every label, as the predict of each model would
+
+        Args:
+            X: Feature matrix
+
+        Returns:
+            Dict[str, np.ndarray]: Predictions of each label
+        """
+        scores = self.decision_function(X)
+        predictions = {}
+        for label, start, stop, classes in self.heads:
+            if stop - start == 1:
+                # binary: the single score is the positive class
+                indices = (scores[:, start] > 0).astype(int)
+            else:
+                indices = scores[:, start:stop].argmax(axis=1)
+            predictions[label] = classes[indices]
+        return predictions
+
+
+def load_combined(model: str, vectorizer: str):
+    """Loads the combined predictor of a model kind, if it exists and is newer than the models
+
+    Returns:
+        Optional[MultiHeadPredictor]: The predictor, or None
+    """
+    path = combined_path(model, vectorizer)
+    if not os.path.exists(path):
+        return None
+    built = os.path.getmtime(path)
+    if any(os.path.getmtime(model_path(label, model, vectorizer)) > built for label in LABELS):
+        print("{} is older than its models, ignoring it".format(path), file=sys.stderr)
+        return None
+    return load(open(path, 'rb'))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Combines the age, gender and zodiac models of a kind "
+                                     "into one predictor, or checks that it predicts like them")
+
+    parser.add_argument("command", choices=["build", "verify"],
+                        help="build the combined model, or verify it on a quiz file")
+    parser.add_argument("model", help="Model kind")
+    parser.add_argument("vectorizer", help="Vectorizer kind")
+    parser.add_argument("--quiz", help="Quiz file to verify on")
+
+    return parser.parse_args()
+
+def main():
+    args = get_args()
+    models = {label: load(open(model_path(label, args.model, args.vectorizer), 'rb')) for label in LABELS}
+
+    if args.command == "build":
+        # pickled as heads.MultiHeadPredictor, not __main__'s, so that quiz.py can load it
+        from heads import MultiHeadPredictor as Predictor
+        with open(combined_path(args.model, args.vectorizer), "wb") as file:
+            dump(Predictor(models), file)
+        print("Saved {}".format(combined_path(args.model, args.vectorizer)))
+        return
+
+    if args.quiz is None:
+        sys.exit("verify needs --quiz")
+    import pandas as pd
+    predictor = load_combined(args.model, args.vectorizer)
+    if predictor is None:
+        sys.exit("No up to date combined model, run build first")
+    from compact import load_vectorizer
+    vectorizer = load_vectorizer(f"data/vectorizers/{args.vectorizer}.vec")
+    with open(args.quiz, "r", encoding='utf-8') as file:
+        test_data = pd.read_csv(file, names=['bloggerID', 'blog'])
+    X_test = vectorizer.transform(test_data['blog'])
+
+    combined = predictor.predict(X_test)
+    mismatches = 0
+    for label, model in models.items():
+        expected = model.predict(X_test)
+        different = int((np.asarray(combined[label]) != expected).sum())
+        mismatches += different
+        print("{}: {} of {} predictions differ".format(label, different, len(expected)))
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from pickle import load
 import argparse
 import pandas as pd
+from compact import load_vectorizer
 
 def get_args():
     parser = argparse.ArgumentParser(description="Finds the properties of the logistic regression model")
@@ -18,7 +19,7 @@ def main():
     args = get_args()
 
     model : LogisticRegression = load(open(args.model, "rb"))
-    vectorizer : TfidfVectorizer = load(open(args.vectorizer, "rb"))
+    vectorizer : TfidfVectorizer = load_vectorizer(args.vectorizer)
 
     int_to_feature = vectorizer.get_feature_names()
 
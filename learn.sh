@@ -1,9 +1,11 @@
 #!/bin/bash
 
 # Executes the learning pipeline for a given label
+# Stages whose inputs did not change since their last run are skipped, see pipeline.py
 if [ $# -ne 5 ] && [ $# -ne 6 ]; then
     echo "Usage: ./learn.sh corpus test-set vectorizer_kind model_kind label [--new-vectorizer]"
     echo "ex. ./learn.sh ./data/excerpt ./data/test tfidf logistic gender --new-vectorizer"
+    exit 1
 fi
 
 corpus=$1
@@ -12,21 +14,4 @@ vectorizer=$3
 model=$4
 label=$5
 
-if [ $# -eq 6 ]; then 
-    python vectorizer.py $corpus data/vectorizers/$vectorizer.vec
-fi
-
-mkdir -p data/models
-python train.py $corpus data/vectorizers/$vectorizer.vec \
-    data/models/$label-$model-$vectorizer.model \
-    --label $label
-
-mkdir -p data/predictions
-python predict.py $test_set data/models/$label-$model-$vectorizer.model \
-    data/vectorizers/$vectorizer.vec data/predictions/$label-$model-$vectorizer.predictions \
-    --label $label
-
-mkdir -p data/performances
-python evaluate.py data/predictions/$label-$model-$vectorizer.predictions \
-    --plot data/performances/$label-$model-$vectorizer.png \
-    > data/performances/$label-$model-$vectorizer.log
+python pipeline.py $corpus $test_set $vectorizer $model --label $label $6
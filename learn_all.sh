@@ -1,6 +1,8 @@
 #!/bin/bash
 
 # Executes the entire machine learning pipeline
+# The stages run one at a time, or concurrently on local slots with --distribute,
+# skipping the stages whose inputs did not change since their last run, see pipeline.py
 if [ $# -lt 4 ] || [ $# -gt 6 ]; then
     echo "Usage: ./learn_all.sh corpus_directory test_directory vectorize_kind model_kind [--distribute] [--new-vectorizer]"
     echo "ex. ./learn_all.sh ./data/excerpt ./data/test tfidf logistic_C20 --distribute"
@@ -12,19 +14,15 @@ test_set=$2
 vectorizer=$3
 model=$4
 
-labels=(gender age zodiac)
-
+options=()
 if [ "$5" == "--new-vectorizer" ] || [ "$6" == "--new-vectorizer" ]; then
-    mkdir -p data/vectorizers
-    python vectorizer.py $corpus data/vectorizers/$vectorizer.vec
+    options+=(--new-vectorizer)
+fi
+# one slot per stage instead of one machine per label, otherwise one stage at a time
+if [ "$5" == "--distribute" ] || [ "$6" == "--distribute" ]; then
+    options+=(--slots 6)
+else
+    options+=(--slots 1)
 fi
 
-for label in "${labels[@]}"; do
-
-    if [ "$5" == "--distribute" ] || [ "$6" == "--distribute" ]; then
-        pkscreen -S learn_$label ssh ens -J arcade \
-            "cd ift6285/project1; ./learn.sh $corpus $test_set $vectorizer $model $label"
-    elif [ $# -eq 4 ] || [ "$5" == "--new-vectorizer" ]; then
-        ./learn.sh $corpus $test_set $vectorizer $model $label
-    fi
-done
+python pipeline.py $corpus $test_set $vectorizer $model "${options[@]}"
@@ -0,0 +1,159 @@
+# Load the blog csv corpus into a single DataFrame
+# Shared by vectorizer.py, train.py and predict.py
+import os
+import resource
+import sys
+import time
+from typing import Dict, Iterator, List, Sequence
+import numpy as np
+import pandas as pd
+from pandas.core.frame import DataFrame
+from corpus.cache import open_corpus
+
+COLUMNS = ['bloggerID', 'gender', 'age', 'zodiac', 'blog']
+DTYPES: Dict[str, str] = {
+    'bloggerID': 'str',
+    'gender': 'str',
+    'age': 'int16',
+    'zodiac': 'str',
+    'blog': 'str',
+}
+
+# Upper bounds (inclusive) of the age categories 0 and 1, anything above is 2
+AGE_BOUNDS = np.array([19, 29])
+
+
+def categorize(ages) -> np.ndarray:
+    """Buckets ages into the categories 0 (<= 19), 1 (20-29) and 2 (30+)
+
+    Args:
+        ages (array-like): Ages of the authors
+
+    Returns:
+        np.ndarray: Age category of every author
+    """
+    return np.searchsorted(AGE_BOUNDS, np.asarray(ages), side='left')
+
+
+def csv_files(directory: str) -> List[str]:
+    """Lists the csv files of the corpus in a stable order
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+
+    Returns:
+        List[str]: Full paths to the csv files
+    """
+    return [os.path.join(directory, file) for file in sorted(os.listdir(directory))
+            if file.endswith(".csv")]
+
+
+def read_csv(path: str, columns: Sequence[str] = COLUMNS) -> DataFrame:
+    """Reads a single blogger csv, keeping only the given columns
+
+    Args:
+        path (str): Path to the csv
+        columns (Sequence[str], optional): Columns to keep. Defaults to all.
+
+    Returns:
+        DataFrame: Blogs of the blogger
+    """
+    return pd.read_csv(path, names=COLUMNS, usecols=list(columns),
+                       dtype={column: DTYPES[column] for column in columns},
+                       na_filter=False, encoding='utf-8')
+
+
+def load_corpus(directory: str, columns: Sequence[str] = COLUMNS,
+                categorize_age: bool = True, verbose: bool = True,
+                compiled: bool = False) -> DataFrame:
+    """Loads every blogger csv of the directory into one DataFrame.
+    The frame is built with a single concatenation.
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+        columns (Sequence[str], optional): Columns to keep. Defaults to all.
+        categorize_age (bool, optional): Whether to bucket the ages. Defaults to True.
+        verbose (bool, optional): Whether to print load time and peak memory. Defaults to True.
+        compiled (bool, optional): Whether to memory-map the compiled corpus
+            (see corpus/cache.py) instead of parsing the csv files. Defaults to False.
+
+    Returns:
+        DataFrame: The corpus, one row per blog
+    """
+    start = time.perf_counter()
+
+    if compiled:
+        corpus = open_corpus(directory).frame(columns)
+    else:
+        frames = [read_csv(path, columns) for path in csv_files(directory)]
+        if frames:
+            corpus = pd.concat(frames, ignore_index=True)
+        else:
+            corpus = DataFrame({column: pd.Series(dtype=DTYPES[column]) for column in columns})
+
+    if categorize_age and 'age' in corpus:
+        corpus['age'] = categorize(corpus['age'])
+
+    if verbose:
+        report(directory, len(corpus), time.perf_counter() - start)
+    return corpus
+
+
+def iter_corpus(directory: str, columns: Sequence[str] = COLUMNS, chunk_size: int = 10000,
+                categorize_age: bool = True, compiled: bool = False) -> Iterator[DataFrame]:
+    """Loads the corpus chunk by chunk, so that only one chunk is in memory.
+    The chunks put together are the DataFrame of load_corpus.
+
+    Args:
+        directory (str): Directory of the blog csv corpus
+        columns (Sequence[str], optional): Columns to keep. Defaults to all.
+        chunk_size (int, optional): Blogs per chunk, the last one may have less. Defaults to 10000.
+        categorize_age (bool, optional): Whether to bucket the ages. Defaults to True.
+        compiled (bool, optional): Whether to memory-map the compiled corpus. Defaults to False.
+
+    Yields:
+        Iterator[DataFrame]: Consecutive rows of the corpus, indexed from 0
+    """
+    def finish(chunk: DataFrame) -> DataFrame:
+        if categorize_age and 'age' in chunk:
+            chunk['age'] = categorize(chunk['age'])
+        return chunk
+
+    if compiled:
+        corpus = open_corpus(directory)
+        for start in range(0, len(corpus), chunk_size):
+            yield finish(corpus.frame(columns, start, min(start + chunk_size, len(corpus))))
+        return
+
+    # pieces of the files making up the next chunk, each row copied once
+    pieces: List[DataFrame] = []
+    size = 0
+    for path in csv_files(directory):
+        frame = read_csv(path, columns)
+        offset = 0
+        while offset < len(frame):
+            piece = frame.iloc[offset:offset + chunk_size - size]
+            pieces.append(piece)
+            offset += len(piece)
+            size += len(piece)
+            if size == chunk_size:
+                yield finish(pd.concat(pieces, ignore_index=True))
+                pieces = []
+                size = 0
+    if size:
+        yield finish(pd.concat(pieces, ignore_index=True))
+
+
+def peak_memory() -> float:
+    """Peak resident memory of the process so far, in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def report(directory: str, rows: int, seconds: float):
+    """Prints loading statistics to stderr
+    """
+    print("Loaded {} blogs from {} in {:.2f}s (peak memory {:.1f} MB)"
+          .format(rows, directory, seconds, peak_memory()), file=sys.stderr)
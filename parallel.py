@@ -0,0 +1,147 @@
+# Parallel fit, transform and prediction with a TfidfVectorizer over a pool of processes
+# The tokenizer is pure Python, so splitting the documents across processes
+# is the only way to use more than one core
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, Sequence, Tuple
+import numpy as np
+import scipy.sparse
+from pandas.core.frame import DataFrame
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+from features import assign_vocabulary
+
+# Documents per task, small enough to balance the load across workers
+SHARD_SIZE = 2000
+
+
+def shards(documents: Sequence[str], shard_size: int = SHARD_SIZE) -> List[List[str]]:
+    """Splits the documents into contiguous shards, keeping their order
+    """
+    documents = list(documents)
+    return [documents[start:start + shard_size] for start in range(0, len(documents), shard_size)]
+
+
+# Vectorizer of the worker processes, sent once when the worker starts
+worker_vectorizer: TfidfVectorizer = None
+
+def set_worker_vectorizer(vectorizer: TfidfVectorizer):
+    global worker_vectorizer
+    worker_vectorizer = vectorizer
+
+def count_document_frequencies(documents: List[str]) -> Counter:
+    analyze = worker_vectorizer.build_analyzer()
+    frequencies: Counter = Counter()
+    for document in documents:
+        frequencies.update(set(analyze(document)))
+    return frequencies
+
+def transform_shard(documents: List[str]) -> csr_matrix:
+    return worker_vectorizer.transform(documents)
+
+
+def is_supported(vectorizer: TfidfVectorizer) -> bool:
+    """Whether fit can be parallelized while staying identical to TfidfVectorizer.fit.
+    Frequency cut-offs and fixed vocabularies need the whole corpus at once.
+    """
+    return isinstance(vectorizer, TfidfVectorizer) and vectorizer.vocabulary is None\
+        and vectorizer.max_df == 1.0 and vectorizer.min_df == 1\
+        and vectorizer.max_features is None and vectorizer.use_idf
+
+
+def fit(vectorizer: TfidfVectorizer, documents: Sequence[str], jobs: int) -> TfidfVectorizer:
+    """Fits the vectorizer with the document frequencies counted in parallel.
+    The fitted vectorizer transforms exactly like one fitted by TfidfVectorizer.fit.
+
+    Args:
+        vectorizer (TfidfVectorizer): Vectorizer to fit
+        documents (Sequence[str]): Training corpus
+        jobs (int): Number of worker processes
+
+    Returns:
+        TfidfVectorizer: The fitted vectorizer
+    """
+    if jobs <= 1 or not is_supported(vectorizer):
+        return vectorizer.fit(documents)
+
+    frequencies: Counter = Counter()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_worker_vectorizer,
+                             initargs=(vectorizer,)) as pool:
+        for partial in pool.map(count_document_frequencies, shards(documents)):
+            frequencies.update(partial)
+    terms = list(frequencies)
+    df = np.array([frequencies[term] for term in terms], dtype=np.float64)
+    return assign_vocabulary(vectorizer, terms, df, len(documents))
+
+
+def transform(vectorizer: TfidfVectorizer, documents: Sequence[str], jobs: int) -> csr_matrix:
+    """Transforms the documents shard by shard in parallel, keeping their order
+
+    Args:
+        vectorizer (TfidfVectorizer): Fitted vectorizer
+        documents (Sequence[str]): Documents to transform
+        jobs (int): Number of worker processes
+
+    Returns:
+        csr_matrix: Same matrix as vectorizer.transform(documents)
+    """
+    if jobs <= 1:
+        return vectorizer.transform(documents)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_worker_vectorizer,
+                             initargs=(vectorizer,)) as pool:
+        parts = list(pool.map(transform_shard, shards(documents)))
+    if not parts:
+        return vectorizer.transform([])
+    return scipy.sparse.vstack(parts, format='csr')
+
+
+# Models of the prediction workers: a dict of fitted models by label,
+# or a predictor whose predict already gives such a dict (see heads.py)
+worker_models = None
+
+def set_worker_predictor(vectorizer: TfidfVectorizer, models):
+    global worker_vectorizer, worker_models
+    worker_vectorizer = vectorizer
+    worker_models = models
+
+def predict_with(vectorizer: TfidfVectorizer, models, documents: Sequence[str]) -> Dict[str, np.ndarray]:
+    X = vectorizer.transform(documents)
+    if isinstance(models, dict):
+        return {label: model.predict(X) for label, model in models.items()}
+    return models.predict(X)
+
+def predict_documents(documents: List[str]) -> Dict[str, np.ndarray]:
+    return predict_with(worker_vectorizer, worker_models, documents)
+
+
+def predict_stream(vectorizer: TfidfVectorizer, models, chunks: Iterable[DataFrame],
+                   jobs: int) -> Iterator[Tuple[DataFrame, Dict[str, np.ndarray]]]:
+    """Transforms and predicts the blogs of each chunk, in parallel but yielded in order.
+    At most two chunks per worker are in memory at once.
+
+    Args:
+        vectorizer (TfidfVectorizer): Fitted vectorizer
+        models: Fitted model of each label, or a predictor of all the labels
+        chunks (Iterable[DataFrame]): Chunks with a blog column, ex. loader.iter_corpus
+        jobs (int): Number of worker processes
+
+    Yields:
+        Iterator[Tuple[DataFrame, Dict[str, np.ndarray]]]: Each chunk with the predictions of its blogs
+    """
+    if jobs <= 1:
+        for chunk in chunks:
+            yield chunk, predict_with(vectorizer, models, chunk['blog'])
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_worker_predictor,
+                             initargs=(vectorizer, models)) as pool:
+        pending: Deque[Tuple[DataFrame, Future]] = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(predict_documents, chunk['blog'].tolist())))
+            if len(pending) >= 2 * jobs:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
@@ -0,0 +1,291 @@
+# Runs the learning pipeline as a graph of stages over the files of data/
+#   vectorize  corpus                      -> data/vectorizers/{vectorizer}.vec
+#   train      corpus, vectorizer          -> data/models/{label}-{model}-{vectorizer}.model of every label
+#   predict    test set, model, vectorizer -> data/predictions/{label}-{model}-{vectorizer}.predictions
+#   evaluate   predictions                 -> data/performances/{label}-{model}-{vectorizer}.log (and .png)
+# A stage is skipped when its outputs exist and neither its command nor its
+# inputs changed since its last run, as recorded in data/pipeline.json.
+# Stages whose inputs are ready run concurrently, in at most --slots processes.
+import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from corpus.cache import fingerprint
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE = os.path.join("data", "pipeline.json")
+LABELS = ("gender", "age", "zodiac")
+
+
+def stamp(path: str):
+    """State of an input: the fingerprint of a corpus directory, or the size
+    and modification time of a file. None if it does not exist.
+    """
+    if os.path.isdir(path):
+        return [list(entry) for entry in fingerprint(path)]
+    if os.path.exists(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    return None
+
+
+class Stage():
+    """One command of the pipeline, with the files it reads and writes
+    """
+
+    def __init__(self, name: str, command: List[str], inputs: List[str], outputs: List[str],
+                 stdout: Optional[str] = None, details: Optional[Callable[["Pipeline"], List[str]]] = None):
+        """
+        Args:
+            name (str): Unique name, ex. predict gender
+            command (List[str]): Arguments of the python scripts, ex. ["train.py", ...]
+            inputs (List[str]): Files and corpus directories read by the command
+            outputs (List[str]): Files written by the command
+            stdout (str, optional): File receiving the standard output. Defaults to the console.
+            details (Callable, optional): Extra arguments known only when the stage starts,
+                given the pipeline, and ignored by the up to date check
+        """
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+        self.stdout = stdout
+        self.details = details
+        self.dependencies: List["Stage"] = []
+        self.status = "pending"
+        self.seconds = 0.0
+
+    def arguments(self, pipeline: "Pipeline") -> List[str]:
+        extra = self.details(pipeline) if self.details is not None else []
+        return [sys.executable, os.path.join(ROOT, self.command[0])] + self.command[1:] + extra
+
+    def state(self) -> Dict:
+        return {"command": self.command, "inputs": {path: stamp(path) for path in self.inputs}}
+
+
+class Pipeline():
+    """Graph of stages, run in dependency order over a pool of slots
+    """
+
+    def __init__(self, stages: List[Stage], state: str = STATE):
+        """Links every stage to the stages producing its inputs
+
+        Args:
+            stages (List[Stage]): Stages, in any order
+            state (str, optional): Record of the last runs. Defaults to data/pipeline.json.
+        """
+        self.stages = stages
+        self.state_path = state
+        producers = {output: stage for stage in stages for output in stage.outputs}
+        for stage in stages:
+            stage.dependencies = [producers[path] for path in stage.inputs if path in producers]
+        self.lock = threading.Lock()
+        try:
+            with open(state) as file:
+                self.state: Dict[str, Dict] = json.load(file)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def is_up_to_date(self, stage: Stage) -> bool:
+        recorded = self.state.get(stage.name)
+        if recorded is None or not all(os.path.exists(output) for output in stage.outputs):
+            return False
+        # through json, as recorded
+        current = json.loads(json.dumps(stage.state()))
+        return recorded["command"] == current["command"] and recorded["inputs"] == current["inputs"]
+
+    def seconds(self, name: str) -> Optional[float]:
+        """Duration of the last run of a stage, even if skipped this time
+        """
+        recorded = self.state.get(name)
+        return None if recorded is None else recorded.get("seconds")
+
+    def save_state(self):
+        folder, _ = os.path.split(self.state_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temporary = "{}.{}.tmp".format(self.state_path, os.getpid())
+        with open(temporary, "w") as file:
+            json.dump(self.state, file, indent=1)
+        os.replace(temporary, self.state_path)
+
+    def execute(self, stage: Stage, force: bool) -> str:
+        """Runs a stage unless it is up to date
+
+        Returns:
+            str: ran, skipped or failed
+        """
+        if not force and self.is_up_to_date(stage):
+            return "skipped"
+        state = stage.state()
+        for output in stage.outputs:
+            folder, _ = os.path.split(output)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        arguments = stage.arguments(self)
+        # one write, as stages start from several threads
+        sys.stderr.write("[{}] {}\n".format(stage.name, " ".join(arguments[1:])))
+
+        start = time.perf_counter()
+        if stage.stdout is not None:
+            with open(stage.stdout, "w") as stdout:
+                process = subprocess.run(arguments, stdout=stdout)
+        else:
+            process = subprocess.run(arguments)
+        stage.seconds = time.perf_counter() - start
+
+        if process.returncode != 0:
+            return "failed"
+        with self.lock:
+            state["seconds"] = stage.seconds
+            self.state[stage.name] = state
+            self.save_state()
+        return "ran"
+
+    def run(self, slots: int = 1, force: bool = False) -> bool:
+        """Runs every stage once its dependencies are done, at most slots at a time.
+        The stages depending on a failed one are blocked, the others still run.
+
+        Returns:
+            bool: Whether no stage failed
+        """
+        running: Dict[Future, Stage] = {}
+        with ThreadPoolExecutor(max_workers=slots) as pool:
+            while True:
+                # a blocked stage blocks the stages depending on it in turn
+                blocking = True
+                while blocking:
+                    blocking = False
+                    for stage in self.stages:
+                        if stage.status == "pending" and any(dependency.status in ("failed", "blocked")
+                                                             for dependency in stage.dependencies):
+                            stage.status = "blocked"
+                            blocking = True
+
+                for stage in self.stages:
+                    if stage.status == "pending" and all(dependency.status in ("ran", "skipped")
+                                                         for dependency in stage.dependencies):
+                        stage.status = "running"
+                        running[pool.submit(self.execute, stage, force)] = stage
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future).status = future.result()
+        return not any(stage.status in ("failed", "blocked") for stage in self.stages)
+
+    def summary(self) -> str:
+        lines = ["{:<24} {:<8} {:>9}".format("stage", "status", "seconds")]
+        for stage in self.stages:
+            seconds = "{:.1f}".format(stage.seconds) if stage.status in ("ran", "failed") else ""
+            lines.append("{:<24} {:<8} {:>9}".format(stage.name, stage.status, seconds))
+        total = sum(stage.seconds for stage in self.stages)
+        lines.append("{:<24} {:<8} {:>9.1f}".format("total", "", total))
+        return "\n".join(lines)
+
+
+def learning_stages(corpus: str, test: str, vectorizer: str, model: str, labels: List[str],
+                    new_vectorizer: bool, plot: bool) -> List[Stage]:
+    """Stages of learn.sh for each label. A single train stage fits every label,
+    on features vectorized once.
+
+    Args:
+        corpus (str): Directory of the training corpus
+        test (str): Directory of the test set
+        vectorizer (str): Vectorizer kind
+        model (str): Model kind
+        labels (List[str]): Labels to learn
+        new_vectorizer (bool): Whether the vectorizer is built here, from the corpus
+        plot (bool): Whether to plot the confusion matrices
+
+    Returns:
+        List[Stage]: The stages
+    """
+    vec = f"data/vectorizers/{vectorizer}.vec"
+    stages = []
+    if new_vectorizer or not os.path.exists(vec):
+        stages.append(Stage("vectorize", ["vectorizer.py", corpus, vec], [corpus], [vec]))
+
+    # train.py fits the labels in parallel on shared features, where separate
+    # stages would each vectorize the corpus
+    saved_models = f"data/models/{{label}}-{model}-{vectorizer}.model"
+    stages.append(Stage("train", ["train.py", corpus, vec, saved_models, "--label"] + list(labels),
+                        [corpus, vec], [saved_models.replace("{label}", label) for label in labels]))
+
+    for label in labels:
+        name = f"{label}-{model}-{vectorizer}"
+        saved_model = f"data/models/{name}.model"
+        predictions = f"data/predictions/{name}.predictions"
+        stages.append(Stage(f"predict {label}", ["predict.py", test, saved_model, vec, predictions,
+                                                 "--label", label],
+                            [test, saved_model, vec], [predictions]))
+
+        command = ["evaluate.py", predictions]
+        outputs = [f"data/performances/{name}.log"]
+        if plot:
+            command += ["--plot", f"data/performances/{name}.png"]
+            outputs.append(f"data/performances/{name}.png")
+
+        def timings(pipeline: Pipeline, label=label) -> List[str]:
+            # recorded in the registry with the metrics; no fit time, the train stage
+            # fits every label together and its time is not that of this label
+            seconds = pipeline.seconds(f"predict {label}")
+            if seconds is None:
+                return []
+            return ["--predict-seconds", "{:.3f}".format(seconds)]
+        stages.append(Stage(f"evaluate {label}", command, [predictions], outputs,
+                            stdout=outputs[0], details=timings))
+    return stages
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Runs the learning pipeline of each label, skipping "
+                                     "the stages whose inputs did not change")
+
+    parser.add_argument("corpus", help="Directory of the blog csv corpus")
+    parser.add_argument("test", help="Directory of the test set")
+    parser.add_argument("vectorizer", help="Vectorizer kind, ex. tfidf")
+    parser.add_argument("model", help="Model kind, ex. logistic_C20")
+
+    parser.add_argument("--label", help="Labels to learn (default: all three)", nargs='+', default=list(LABELS))
+    parser.add_argument("--slots", help="Stages running at once (default: %(default)s)", type=int, default=3)
+    parser.add_argument("--new-vectorizer", help="Fit the vectorizer on the corpus, "
+        "when it is not up to date", const=True, action='store_const', default=False)
+    parser.add_argument("--no-plot", help="Do not plot the confusion matrices",
+                        const=True, action='store_const', default=False)
+    parser.add_argument("--force", help="Run every stage, even up to date ones",
+                        const=True, action='store_const', default=False)
+    parser.add_argument("--dry-run", help="Only list the stages and whether they are up to date",
+                        const=True, action='store_const', default=False)
+    parser.add_argument("--state", help="Record of the last runs (default: %(default)s)", default=STATE)
+
+    return parser.parse_args()
+
+def main():
+    args = get_args()
+
+    stages = learning_stages(args.corpus, args.test, args.vectorizer, args.model, args.label,
+                             args.new_vectorizer, not args.no_plot)
+    pipeline = Pipeline(stages, args.state)
+
+    if args.dry_run:
+        for stage in stages:
+            # inputs of later stages may not exist yet
+            up_to_date = not args.force and pipeline.is_up_to_date(stage)
+            print("{:<24} {}".format(stage.name, "up to date" if up_to_date else "to run"))
+        return
+
+    start = time.perf_counter()
+    success = pipeline.run(args.slots, args.force)
+    print(pipeline.summary())
+    print("Finished in {:.1f}s".format(time.perf_counter() - start))
+    if not success:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 # Make predictions on the test set
 import argparse
 import os
-from pickle import dump, load
+from pickle import load
+import numpy as np
 import pandas as pd
-from pandas.core.frame import DataFrame
+from loader import iter_corpus, load_corpus
+import parallel
+from compact import load_vectorizer
+from predictions import save_predictions
+from features import DEFAULT_DIRECTORY, DEFAULT_SIZE, FeatureCache, cache_key, load_token_store
 
 def get_args():
     parser = argparse.ArgumentParser(description="Makes predictions and saves them to disk")
@@ -16,45 +21,81 @@ def get_args():
     parser.add_argument("--label", help="Which label to predict, ex. 'gender' (default), 'age', 'zodiac'",\
         default="gender")
 
+    parser.add_argument("--compiled", help="Memory-map the compiled corpus instead of parsing the csv files "
+        "(compiled on first use, see corpus/cache.py)", const=True, action='store_const', default=False)
+
+    parser.add_argument("--feature-cache", help="Where to cache transformed corpora (default: data/features)",\
+        default=DEFAULT_DIRECTORY)
+    parser.add_argument("--cache-size", help="Size of the feature cache in MB (default: %(default)s)",\
+        type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--no-cache", help="Always transform the corpus, without the feature cache",\
+        const=True, action='store_const', default=False)
+    parser.add_argument("--vectorize-jobs", help="Worker processes transforming the corpus (default: 1)",\
+        type=int, default=1)
+    parser.add_argument("--tokens", help="The corpus is a token store (corpus/preprocessing.py --tokens): "
+        "build the features from its token IDs without tokenizing", const=True, action='store_const', default=False)
+
+    parser.add_argument("--chunksize", help="Read, transform and predict this many blogs at a time, "
+        "so that the test set never is in memory at once. The workers of --vectorize-jobs then "
+        "predict as well. Skips the feature cache", type=int, default=None)
+
     return parser.parse_args()
 
+def predict_chunks(args, model):
+    """True and predicted labels of the test set, read chunk by chunk
+    """
+    truth = []
+    predictions = []
+    chunks = iter_corpus(args.test, columns=['blog', args.label], chunk_size=args.chunksize,
+                         compiled=args.compiled)
+    vectorizer = load_vectorizer(args.vectorizer)
+    for chunk, y in parallel.predict_stream(vectorizer, {args.label: model}, chunks, args.vectorize_jobs):
+        truth.append(chunk[args.label])
+        predictions.append(y[args.label])
+
+    # same objects as without chunks
+    if not truth:
+        empty = load_corpus(args.test, columns=[args.label], compiled=args.compiled, verbose=False)
+        return empty[args.label], np.empty(0, dtype=model.classes_.dtype)
+    return pd.concat(truth, ignore_index=True), np.concatenate(predictions)
+
 def main():
     args = get_args()
 
-    # Get vectorizer
-    vectorizer = load(open(args.vectorizer, 'rb'))
-
     # Get model
     model = load(open(args.model, 'rb'))
 
-    # Read test set
-    def categorize(age: str) -> int:
-        if int(age) <= 19:
-            return 0
-        elif int(age) <= 29:
-            return 1
+    if args.chunksize is not None:
+        if args.tokens:
+            raise SystemExit("--chunksize reads csv files, not token stores")
+        truth, y = predict_chunks(args, model)
+    else:
+        # Reuse the transformed test set of a previous run, if any
+        cache = None if args.no_cache or args.tokens else FeatureCache(args.feature_cache, args.cache_size)
+        # the key hashes the vectorizer file, only worth it with a cache
+        key = None if cache is None else cache_key(args.vectorizer, args.test)
+        X_test = None if cache is None else cache.load(key)
+
+        # Read test set
+        if args.tokens:
+            X_test, test_data = load_token_store(args.test, args.vectorizer)
         else:
-            return 2
-    test_data : DataFrame = None
-    for csv_file in os.listdir(args.test):
-        with open(os.path.join(args.test, csv_file), encoding='utf-8') as file:
-            data = pd.read_csv(file, names=['bloggerID', 'gender', 'age', 'zodiac', 'blog'])
-            if test_data is None:
-                test_data = data
-            else:
-                test_data = test_data.append(data)
-    test_data['age'] = test_data['age'].apply(categorize)
-
-    # Predict
-    X_test = vectorizer.transform(test_data['blog'])
-    y = model.predict(X_test)
+            columns = ['blog', args.label] if X_test is None else [args.label]
+            test_data = load_corpus(args.test, columns=columns, compiled=args.compiled)
+
+        # Predict
+        if X_test is None:
+            vectorizer = load_vectorizer(args.vectorizer)
+            X_test = parallel.transform(vectorizer, test_data['blog'], args.vectorize_jobs)
+            if cache is not None:
+                cache.save(key, X_test)
+        truth, y = test_data[args.label], model.predict(X_test)
 
     # Save predictions
     save_folder, _ = os.path.split(args.save)
     os.makedirs(save_folder, exist_ok=True)
 
-    with open(args.save, "wb") as predictions:
-        dump([test_data[args.label], y], predictions)
+    save_predictions(args.save, truth, y)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,106 @@
+# Compact predictions files, written by predict.py and read by evaluate.py
+# The true and predicted labels of a test set are small integer codes into a
+# sorted table of the labels, saved as .npz arrays:
+#   labels      the label table, sorted as sklearn's unique_labels sorts it
+#   truth       code of the true label of each blog
+#   predicted   code of the predicted label of each blog
+# Older pickles of [truth, predicted] still load.
+import zipfile
+from pickle import load
+from typing import Iterable, Tuple
+import numpy as np
+
+
+def encode(truth, predicted) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Codes the true and predicted labels into a shared label table
+
+    Returns:
+        np.ndarray: Sorted label table
+        np.ndarray: Codes of the true labels
+        np.ndarray: Codes of the predicted labels
+    """
+    truth = np.asarray(truth)
+    predicted = np.asarray(predicted)
+    labels = np.union1d(truth, predicted)
+    if labels.dtype == object:
+        labels = labels.astype(str)
+    dtype = np.min_scalar_type(max(len(labels) - 1, 0))
+    return labels, np.searchsorted(labels, truth).astype(dtype), np.searchsorted(labels, predicted).astype(dtype)
+
+
+def save_predictions(path: str, truth, predicted):
+    """Saves the true and predicted labels of a test set
+
+    Args:
+        path (str): Predictions file, written as is (no .npz added)
+        truth: True labels
+        predicted: Predicted labels
+    """
+    labels, truth, predicted = encode(truth, predicted)
+    with open(path, "wb") as file:
+        np.savez(file, labels=labels, truth=truth, predicted=predicted)
+
+
+def load_predictions(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Loads a predictions file, compact or pickled
+
+    Returns:
+        np.ndarray: Sorted label table
+        np.ndarray: Codes of the true labels
+        np.ndarray: Codes of the predicted labels
+    """
+    if not zipfile.is_zipfile(path):
+        with open(path, "rb") as file:
+            return encode(*load(file))
+    with np.load(path) as arrays:
+        return arrays["labels"], arrays["truth"], arrays["predicted"]
+
+
+def read_labels(path: str) -> np.ndarray:
+    """Label table of a predictions file, without reading its codes
+    """
+    if not zipfile.is_zipfile(path):
+        return load_predictions(path)[0]
+    with np.load(path) as arrays:
+        return arrays["labels"]
+
+
+def confusion(paths: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Confusion matrix of several prediction shards, accumulated one shard at a time
+
+    Args:
+        paths (Iterable[str]): Predictions files of the same label, ex. of parts of the test set
+
+    Returns:
+        np.ndarray: Sorted table of the labels of all shards
+        np.ndarray: Confusion matrix, rows are true labels and columns predictions
+    """
+    paths = list(paths)
+    # the label tables are tiny, the codes are read once each
+    labels = np.array([])
+    for path in paths:
+        labels = np.union1d(labels, read_labels(path)) if len(labels) else read_labels(path)
+
+    matrix = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    for path in paths:
+        shard_labels, truth, predicted = load_predictions(path)
+        columns = np.searchsorted(labels, shard_labels)
+        size = len(shard_labels)
+        counts = np.bincount(truth.astype(np.int64) * size + predicted, minlength=size * size)
+        matrix[np.ix_(columns, columns)] += counts.reshape(size, size)
+    return labels, matrix
+
+
+def expand(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Code pairs with the given confusion matrix, one per blog
+
+    Returns:
+        np.ndarray: Codes of the true labels
+        np.ndarray: Codes of the predicted labels
+    """
+    size = len(matrix)
+    dtype = np.min_scalar_type(max(size - 1, 0))
+    counts = matrix.ravel()
+    truth = np.repeat(np.repeat(np.arange(size, dtype=dtype), size), counts)
+    predicted = np.repeat(np.tile(np.arange(size, dtype=dtype), size), counts)
+    return truth, predicted
@@ -12,6 +12,7 @@ mkdir -p $data_train_processed
 mkdir -p $data_test_processed
 mkdir -p $logs
 
-# call the preprocessor with pkscreen
-pkscreen bash -c "{ time python corpus/preprocessing.py $data_train $data_train_processed ; } 2> $logs/time_preprocess_train.log"
-pkscreen bash -c "{ time python corpus/preprocessing.py $data_test $data_test_processed ; } 2> $logs/time_preprocess_test.log"
\ No newline at end of file
+# call the preprocessor with pkscreen, one worker process per core
+jobs=$(nproc)
+pkscreen bash -c "{ time python corpus/preprocessing.py $data_train $data_train_processed --jobs $jobs ; } 2> $logs/time_preprocess_train.log"
+pkscreen bash -c "{ time python corpus/preprocessing.py $data_test $data_test_processed --jobs $jobs ; } 2> $logs/time_preprocess_test.log"
\ No newline at end of file
@@ -5,6 +5,9 @@ from pickle import dump, load
 import pandas as pd
 from pandas.core.frame import DataFrame
 import csv
+from heads import load_combined
+from compact import load_vectorizer
+from parallel import predict_stream, predict_with
 csv.field_size_limit(1000000)
 
 def get_args():
@@ -15,41 +18,86 @@ def get_args():
     parser.add_argument("vectorizer", help="Vectorizer kind")
     parser.add_argument("save", help="Save file for the predictions")
 
+    parser.add_argument("--server", help="Ask a running prediction daemon (see serve.py) "
+                        "instead of loading the vectorizer and models, e.g. http://127.0.0.1:8000")
+
+    parser.add_argument("--chunksize", help="Read, predict and write this many blogs at a time, "
+                        "so that the quiz file never is in memory at once", type=int, default=None)
+    parser.add_argument("--jobs", help="Worker processes predicting the chunks of --chunksize (default: 1)",
+                        type=int, default=1)
+
     return parser.parse_args()
 
+def load_models(model: str, vectorizer: str):
+    """The combined predictor of the three labels (see heads.py), or else their models
+    """
+    combined = load_combined(model, vectorizer)
+    if combined is not None:
+        return combined
+    return {label: load(open(f"data/models/{label}-{model}-{vectorizer}.model", 'rb'))
+            for label in ("age", "gender", "zodiac")}
+
+def write_predictions(file, blogger_ids, y_gender, y_age, y_zodiac):
+    y_all = DataFrame(columns=["bloggerID", "gender", "age", "zodiac"])
+    y_all["bloggerID"] = blogger_ids
+    y_all["gender"] = y_gender
+    y_all["age"] = y_age
+    y_all["zodiac"] = y_zodiac
+    y_all.to_csv(file, header=False, index=False)
+
+def stream(args):
+    """Predicts the quiz file chunk by chunk, appending to the save file as it goes
+    """
+    # a chunk of numeric blogs would otherwise be parsed as numbers
+    chunks = pd.read_csv(args.quiz, names=['bloggerID', 'blog'], dtype={'blog': str}, encoding='utf-8',
+                         chunksize=args.chunksize)
+    if args.server is not None:
+        from serve import predict_remote
+        def predicted():
+            for chunk in chunks:
+                predictions = predict_remote(args.server, chunk['blog'].tolist())
+                yield chunk, {label: [prediction[label] for prediction in predictions]
+                              for label in ("age", "gender", "zodiac")}
+        results = predicted()
+    else:
+        vectorizer = load_vectorizer(f"data/vectorizers/{args.vectorizer}.vec")
+        results = predict_stream(vectorizer, load_models(args.model, args.vectorizer), chunks, args.jobs)
+
+    with open(args.save, "w") as predictions:
+        for chunk, y in results:
+            write_predictions(predictions, chunk["bloggerID"], y["gender"], y["age"], y["zodiac"])
+
 def main():
     args = get_args()
 
-    # Get vectorizer
-    vectorizer = load(open(f"data/vectorizers/{args.vectorizer}.vec", 'rb'))
-
-    # Get models
-    age_model = load(open(f"data/models/age-{args.model}-{args.vectorizer}.model", 'rb'))
-    gender_model = load(open(f"data/models/gender-{args.model}-{args.vectorizer}.model", 'rb'))
-    zodiac_model = load(open(f"data/models/zodiac-{args.model}-{args.vectorizer}.model", 'rb'))
+    save_folder, _ = os.path.split(args.save)
+    os.makedirs(save_folder, exist_ok=True)
+    if args.chunksize is not None:
+        stream(args)
+        return
 
     # Read quiz set
     with open(args.quiz, "r", encoding='utf-8') as file:
         test_data = pd.read_csv(file, names=['bloggerID', 'blog'])
 
-    # Predict
-    X_test = vectorizer.transform(test_data['blog'])
-    y_age = age_model.predict(X_test)
-    y_gender = gender_model.predict(X_test)
-    y_zodiac = zodiac_model.predict(X_test)
+    if args.server is not None:
+        # The daemon already has the vectorizer and models in memory
+        from serve import predict_remote
+        predictions = predict_remote(args.server, test_data['blog'].tolist())
+        y_age = [prediction["age"] for prediction in predictions]
+        y_gender = [prediction["gender"] for prediction in predictions]
+        y_zodiac = [prediction["zodiac"] for prediction in predictions]
+    else:
+        # Get vectorizer
+        vectorizer = load_vectorizer(f"data/vectorizers/{args.vectorizer}.vec")
 
-    # Save predictions
-    save_folder, _ = os.path.split(args.save)
-    os.makedirs(save_folder, exist_ok=True)
-
-    y_all = DataFrame(columns=["bloggerID", "gender", "age", "zodiac"])
-    y_all["bloggerID"] = test_data["bloggerID"]
-    y_all["gender"] = y_gender
-    y_all["age"] = y_age
-    y_all["zodiac"] = y_zodiac
+        # Get models, combined when possible so that the three labels take one product
+        y = predict_with(vectorizer, load_models(args.model, args.vectorizer), test_data['blog'])
+        y_age, y_gender, y_zodiac = y["age"], y["gender"], y["zodiac"]
 
+    # Save predictions
     with open(args.save, "w") as predictions:
-        y_all.to_csv(predictions, header=False, index=False)
+        write_predictions(predictions, test_data["bloggerID"], y_gender, y_age, y_zodiac)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
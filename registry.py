@@ -0,0 +1,195 @@
+# Registry of evaluated runs, in a local SQLite database
+# evaluate.py (and sweep.py) record the metrics of every run: accuracy, macro and
+# weighted F1, and the precision, recall, F1 and support of each class, with the
+# label, model and vectorizer kinds and the fit and predict times when known.
+# examine.py then ranks runs with indexed queries instead of reading every .log.
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_PATH = os.path.join("data", "runs.sqlite")
+
+METRICS = ("accuracy", "macro_f1", "weighted_f1")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    label TEXT,
+    model TEXT,
+    vectorizer TEXT,
+    predictions TEXT,
+    accuracy REAL,
+    macro_f1 REAL,
+    weighted_f1 REAL,
+    support INTEGER,
+    fit_seconds REAL,
+    predict_seconds REAL,
+    recorded REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS classes (
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    class TEXT NOT NULL,
+    precision REAL,
+    recall REAL,
+    f1 REAL,
+    support INTEGER,
+    PRIMARY KEY (run, class)
+);
+CREATE INDEX IF NOT EXISTS runs_accuracy ON runs(label, accuracy);
+CREATE INDEX IF NOT EXISTS runs_macro_f1 ON runs(label, macro_f1);
+CREATE INDEX IF NOT EXISTS runs_weighted_f1 ON runs(label, weighted_f1);
+CREATE INDEX IF NOT EXISTS runs_model ON runs(model);
+CREATE INDEX IF NOT EXISTS runs_vectorizer ON runs(vectorizer);
+"""
+
+# averages of classification_report, not classes
+AVERAGES = ("accuracy", "macro avg", "weighted avg", "micro avg")
+
+
+def parse_name(name: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Label, model and vectorizer kinds of a run named as learn.sh names its files,
+    ex. gender-logistic_C20-tfidf. Labels and vectorizers have no hyphen, models may
+    (ex. logistic_C1e-05).
+    """
+    label, _, rest = name.partition("-")
+    model, _, vectorizer = rest.rpartition("-")
+    if not label or not model or not vectorizer:
+        return None, None, None
+    return label, model, vectorizer
+
+
+def parse_log(path: str) -> Dict:
+    """Reads a .log of evaluate.py back into the dict of classification_report(output_dict=True),
+    for runs evaluated before the registry
+    """
+    report: Dict = {}
+    for line in open(path, "r"):
+        words = line.split()
+        if not words or line.lstrip().startswith("["):
+            continue
+        if words[0] == "accuracy" and len(words) == 3:
+            report["accuracy"] = float(words[1])
+        elif words[:2] in (["macro", "avg"], ["weighted", "avg"]) and len(words) == 6:
+            report[" ".join(words[:2])] = {"precision": float(words[2]), "recall": float(words[3]),
+                                           "f1-score": float(words[4]), "support": int(words[5])}
+        elif len(words) >= 5 and words[0] != "precision":
+            # class names may have spaces
+            try:
+                precision, recall, f1, support = float(words[-4]), float(words[-3]), float(words[-2]), int(words[-1])
+            except ValueError:
+                continue
+            report[" ".join(words[:-4])] = {"precision": precision, "recall": recall,
+                                            "f1-score": f1, "support": support}
+    return report
+
+
+class Registry():
+    """Local database of the metrics of evaluated runs
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        """Opens the registry, creating it if needed
+
+        Args:
+            path (str, optional): SQLite file. Defaults to data/runs.sqlite.
+        """
+        folder, _ = os.path.split(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        # sweep.py workers record concurrently
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> "Registry":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def has(self, name: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM runs WHERE name = ?", (name,)).fetchone() is not None
+
+    def record(self, name: str, report: Dict, predictions: Optional[str] = None,
+               fit_seconds: Optional[float] = None, predict_seconds: Optional[float] = None,
+               label: Optional[str] = None, model: Optional[str] = None,
+               vectorizer: Optional[str] = None) -> int:
+        """Records a run, replacing any previous run of the same name
+
+        Args:
+            name (str): Run name, ex. gender-logistic_C20-tfidf
+            report (Dict): classification_report(output_dict=True) of the run
+            predictions (str, optional): Predictions file(s) of the run
+            fit_seconds (float, optional): Training time
+            predict_seconds (float, optional): Prediction time
+            label, model, vectorizer (str, optional): Kinds of the run. Default to the parts of its name.
+
+        Returns:
+            int: Identifier of the run
+        """
+        parsed = parse_name(name)
+        label = label or parsed[0]
+        model = model or parsed[1]
+        vectorizer = vectorizer or parsed[2]
+        classes = {key: value for key, value in report.items() if key not in AVERAGES}
+        macro = report.get("macro avg", {})
+        weighted = report.get("weighted avg", {})
+
+        with self.connection:
+            self.connection.execute("DELETE FROM runs WHERE name = ?", (name,))
+            cursor = self.connection.execute(
+                "INSERT INTO runs (name, label, model, vectorizer, predictions, accuracy, macro_f1,"
+                " weighted_f1, support, fit_seconds, predict_seconds, recorded)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, label, model, vectorizer, predictions, report.get("accuracy"),
+                 macro.get("f1-score"), weighted.get("f1-score"), macro.get("support"),
+                 fit_seconds, predict_seconds, time.time()))
+            run = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO classes (run, class, precision, recall, f1, support) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run, str(key), value["precision"], value["recall"], value["f1-score"], int(value["support"]))
+                 for key, value in classes.items()])
+        return run
+
+    def best(self, metric: str = "accuracy", label: Optional[str] = None, model: Optional[str] = None,
+             vectorizer: Optional[str] = None, limit: Optional[int] = None) -> List[sqlite3.Row]:
+        """Runs ranked by a metric, best first
+
+        Args:
+            metric (str, optional): accuracy, macro_f1 or weighted_f1. Defaults to accuracy.
+            label, model, vectorizer (str, optional): Only runs of these kinds.
+                Model and vectorizer accept SQL LIKE patterns, ex. logistic%.
+            limit (int, optional): Most runs returned. Defaults to all.
+
+        Returns:
+            List[sqlite3.Row]: Rows of the runs table
+        """
+        if metric not in METRICS:
+            raise ValueError("Unknown metric {}, expected one of {}".format(metric, ", ".join(METRICS)))
+        conditions = ["{} IS NOT NULL".format(metric)]
+        parameters: List = []
+        if label is not None:
+            conditions.append("label = ?")
+            parameters.append(label)
+        if model is not None:
+            conditions.append("model LIKE ?")
+            parameters.append(model)
+        if vectorizer is not None:
+            conditions.append("vectorizer LIKE ?")
+            parameters.append(vectorizer)
+        query = "SELECT * FROM runs WHERE {} ORDER BY {} DESC, name".format(" AND ".join(conditions), metric)
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        return self.connection.execute(query, parameters).fetchall()
+
+    def classes(self, run: int) -> List[sqlite3.Row]:
+        """Metrics of each class of a run
+        """
+        return self.connection.execute("SELECT * FROM classes WHERE run = ? ORDER BY class", (run,)).fetchall()
@@ -0,0 +1,248 @@
+# Prediction daemon: keeps a vectorizer and its age, gender and zodiac models in memory
+# and predicts the three labels of blogs posted to a localhost HTTP server.
+# Concurrent requests are batched into a single transform.
+#
+#   POST /predict  {"blogs": ["...", ...]}  ->  {"predictions": [{"gender": .., "age": .., "zodiac": ..}, ...]}
+#   GET  /stats    latency and throughput counters
+import argparse
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pickle import load
+from queue import Empty, Queue
+import sys
+import threading
+import time
+from typing import Deque, Dict, List, Tuple
+import numpy as np
+from compact import load_vectorizer
+
+LABELS = ("gender", "age", "zodiac")
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Serves the predictions of a vectorizer and model kind "
+                                     "over HTTP, loading them only once")
+
+    parser.add_argument("model", help="Model kind")
+    parser.add_argument("vectorizer", help="Vectorizer kind")
+
+    parser.add_argument("--host", help="Address to listen on (default: %(default)s)", default="127.0.0.1")
+    parser.add_argument("--port", help="Port to listen on (default: %(default)s)", type=int, default=8000)
+
+    parser.add_argument("--batch-size", help="Most blogs transformed at once (default: %(default)s)",
+                        type=int, default=512)
+    parser.add_argument("--wait", help="Milliseconds to wait for other requests to join a batch "
+                        "(default: %(default)s)", type=float, default=5)
+
+    return parser.parse_args()
+
+
+class Stats():
+    """Latency and throughput counters of the server
+    """
+
+    # latencies kept for the percentiles
+    WINDOW = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.blogs = 0
+        self.batches = 0
+        self.batched_blogs = 0
+        self.latencies: Deque[float] = deque(maxlen=self.WINDOW)
+
+    def request(self, blogs: int, latency: float):
+        with self.lock:
+            self.requests += 1
+            self.blogs += blogs
+            self.latencies.append(latency)
+
+    def batch(self, blogs: int):
+        with self.lock:
+            self.batches += 1
+            self.batched_blogs += blogs
+
+    def report(self) -> Dict:
+        with self.lock:
+            uptime = time.perf_counter() - self.start
+            latencies = np.array(self.latencies) * 1000
+            report = {
+                "uptime (s)": uptime,
+                "requests": self.requests,
+                "blogs": self.blogs,
+                "batches": self.batches,
+                "mean batch size": self.batched_blogs / self.batches if self.batches else 0,
+                "requests/s": self.requests / uptime,
+                "blogs/s": self.blogs / uptime,
+            }
+        if len(latencies):
+            for percentile in (50, 95, 99):
+                report["latency p{} (ms)".format(percentile)] = float(np.percentile(latencies, percentile))
+            report["latency max (ms)"] = float(latencies.max())
+        return report
+
+
+class Batcher():
+    """Gathers the blogs of concurrent requests and predicts them together
+    """
+
+    def __init__(self, vectorizer, models: Dict, batch_size: int, wait: float, stats: Stats):
+        """Starts the prediction thread
+
+        Args:
+            vectorizer: Fitted vectorizer
+            models (Dict): Fitted model of each label
+            batch_size (int): Most blogs transformed at once
+            wait (float): Seconds to wait for other requests to join a batch
+            stats (Stats): Counters to update
+        """
+        self.vectorizer = vectorizer
+        self.models = models
+        self.batch_size = batch_size
+        self.wait = wait
+        self.stats = stats
+        self.requests: Queue[Tuple[List[str], Future]] = Queue()
+        threading.Thread(target=self.run, name="predictor", daemon=True).start()
+
+    def predict(self, blogs: List[str]) -> List[Dict]:
+        """Predicts the labels of the blogs, blocking until their batch is done
+        """
+        future: Future = Future()
+        self.requests.put((blogs, future))
+        return future.result()
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.wait
+            # the first request waits at most self.wait for company
+            while size < self.batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self.predict_batch(batch)
+
+    def predict_batch(self, batch: List[Tuple[List[str], Future]]):
+        blogs = [blog for request, _ in batch for blog in request]
+        try:
+            if blogs:
+                X = self.vectorizer.transform(blogs)
+                predictions = {label: model.predict(X).tolist() for label, model in self.models.items()}
+            else:
+                predictions = {label: [] for label in self.models}
+        except Exception as error:
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        self.stats.batch(len(blogs))
+
+        start = 0
+        for request, future in batch:
+            stop = start + len(request)
+            future.set_result([{label: predictions[label][index] for label in LABELS}
+                               for index in range(start, stop)])
+            start = stop
+
+
+def make_handler(batcher: Batcher, stats: Stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status: int, content):
+            body = json.dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(200, stats.report())
+            else:
+                self.send_json(404, {"error": "unknown path {}".format(self.path)})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.send_json(404, {"error": "unknown path {}".format(self.path)})
+                return
+            start = time.perf_counter()
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                blogs = request["blogs"]
+                if not isinstance(blogs, list) or not all(isinstance(blog, str) for blog in blogs):
+                    raise ValueError("blogs must be a list of strings")
+            except (KeyError, TypeError, ValueError) as error:
+                self.send_json(400, {"error": str(error)})
+                return
+            try:
+                predictions = batcher.predict(blogs)
+            except Exception as error:
+                self.send_json(500, {"error": str(error)})
+                return
+            stats.request(len(blogs), time.perf_counter() - start)
+            self.send_json(200, {"predictions": predictions})
+
+        def log_message(self, format, *args):
+            # one line per request would cost more than the prediction
+            pass
+    return Handler
+
+
+def predict_remote(server: str, blogs: List[str], chunk_size: int = 512) -> List[Dict]:
+    """Predicts the labels of the blogs with a running prediction daemon
+
+    Args:
+        server (str): Address of the daemon, e.g. http://127.0.0.1:8000
+        blogs (List[str]): Blogs to predict
+        chunk_size (int, optional): Blogs per request. Defaults to 512.
+
+    Returns:
+        List[Dict]: Gender, age and zodiac of each blog
+    """
+    from urllib.request import Request, urlopen
+    predictions: List[Dict] = []
+    for start in range(0, len(blogs), chunk_size):
+        body = json.dumps({"blogs": blogs[start:start + chunk_size]}).encode('utf-8')
+        request = Request(server.rstrip("/") + "/predict", data=body,
+                          headers={"Content-Type": "application/json"})
+        with urlopen(request) as response:
+            predictions.extend(json.load(response)["predictions"])
+    return predictions
+
+
+def main():
+    args = get_args()
+
+    # Loaded once for the lifetime of the server
+    start = time.perf_counter()
+    vectorizer = load_vectorizer(f"data/vectorizers/{args.vectorizer}.vec")
+    models = {label: load(open(f"data/models/{label}-{args.model}-{args.vectorizer}.model", 'rb'))
+              for label in LABELS}
+    print("Loaded {} and {} models in {:.1f}s".format(args.vectorizer, args.model, time.perf_counter() - start),
+          file=sys.stderr)
+
+    stats = Stats()
+    batcher = Batcher(vectorizer, models, args.batch_size, args.wait / 1000, stats)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, stats))
+    print("Serving on http://{}:{}".format(args.host, args.port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Share a sparse feature matrix with worker processes through shared memory
+# Only the names of the memory blocks are pickled, never the matrix buffers
+from multiprocessing import shared_memory
+from typing import List, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# (shape, [(block name, dtype, length) for data, indices and indptr])
+Spec = Tuple[Tuple[int, int], List[Tuple[str, str, int]]]
+
+
+class SharedCSR():
+    """Copy of a CSR matrix living in shared memory
+    """
+
+    def __init__(self, matrix: csr_matrix):
+        """Copies the buffers of the matrix into new shared memory blocks
+
+        Args:
+            matrix (csr_matrix): Matrix to share
+        """
+        matrix = csr_matrix(matrix)
+        self.blocks: List[shared_memory.SharedMemory] = []
+        buffers = []
+        for array in (matrix.data, matrix.indices, matrix.indptr):
+            # shared memory blocks cannot be empty
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            buffers.append((block.name, array.dtype.str, len(array)))
+        self.spec: Spec = (matrix.shape, buffers)
+
+    def close(self):
+        """Releases the shared memory blocks. Attached workers must be done.
+        """
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+    def __enter__(self) -> "SharedCSR":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def attach(spec: Spec) -> Tuple[csr_matrix, List[shared_memory.SharedMemory]]:
+    """Rebuilds, without copying, a matrix shared by another process
+
+    Args:
+        spec (Spec): SharedCSR.spec of the owner
+
+    Returns:
+        csr_matrix: The shared matrix, read-only
+        List[SharedMemory]: Handles to keep alive as long as the matrix is used
+    """
+    shape, buffers = spec
+    blocks = []
+    arrays = []
+    for name, dtype, length in buffers:
+        block = shared_memory.SharedMemory(name=name)
+        array = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        blocks.append(block)
+        arrays.append(array)
+    data, indices, indptr = arrays
+    return csr_matrix((data, indices, indptr), shape=shape, copy=False), blocks
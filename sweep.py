@@ -0,0 +1,217 @@
+# Sweep of classifier configurations on features vectorized once
+# The train and test sets are transformed once (or taken from the feature cache)
+# and shared with worker processes, which fit every configuration of the grid.
+# Each configuration gets the model, predictions and .log report of learn.sh,
+# so that examine.py ranks it with the others.
+# Configurations differing only by C form a regularization path, fitted in
+# order by a single worker from the strongest regularization, each fit
+# warm-started from the solution of the previous one.
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import os
+import sys
+import time
+from typing import List, NamedTuple, Optional, Tuple
+import numpy as np
+from features import DEFAULT_DIRECTORY, DEFAULT_SIZE
+from shared import SharedCSR, attach
+from train import load_features, save_model
+from predictions import confusion, save_predictions
+from evaluate import record, report
+from registry import DEFAULT_PATH
+
+KINDS = ("logistic", "svm")
+
+
+class Config(NamedTuple):
+    """One classifier configuration of the grid
+    """
+    kind: str
+    C: float
+    solver: Optional[str] = None
+    penalty: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        # model kind of learn.sh, ex. logistic_C20
+        name = "{}_C{:g}".format(self.kind, self.C)
+        if self.solver is not None:
+            name += "_" + self.solver
+        if self.penalty is not None:
+            name += "_" + self.penalty
+        return name
+
+
+def make_classifier(config: Config, max_iter: Optional[int] = None):
+    # one process per path, so every classifier is single-threaded
+    options = {} if config.penalty is None else {"penalty": config.penalty}
+    if max_iter is not None:
+        options["max_iter"] = max_iter
+    if config.kind == "logistic":
+        from sklearn.linear_model import LogisticRegression
+        if config.solver is not None:
+            options["solver"] = config.solver
+        # warm_start is ignored by liblinear
+        return LogisticRegression(C=config.C, multi_class='ovr', warm_start=True, **options)
+    from sklearn.svm import LinearSVC
+    return LinearSVC(C=config.C, **options)
+
+
+def paths(kind: str, Cs: List[float], solvers: List[Optional[str]],
+          penalties: List[Optional[str]]) -> List[List[Config]]:
+    """Splits the grid into regularization paths, ordered from the smallest C
+    """
+    return [[Config(kind, C, solver, penalty) for C in sorted(set(Cs))]
+            for solver, penalty in product(solvers, penalties)]
+
+
+def output_paths(data: str, label: str, config: Config, vectorizer: str) -> Tuple[str, str, str]:
+    """Model, predictions and report files of a configuration, as learn.sh names them
+    """
+    stem = "{}-{}-{}".format(label, config.name, vectorizer)
+    return (os.path.join(data, "models", stem + ".model"),
+            os.path.join(data, "predictions", stem + ".predictions"),
+            os.path.join(data, "performances", stem + ".log"))
+
+
+# Train and test features of the worker processes, attached from shared memory
+worker_features = None
+
+def attach_features(train_spec, test_spec):
+    global worker_features
+    worker_features = (attach(train_spec), attach(test_spec))
+
+def detach_features():
+    # the views go before their shared memory blocks are closed
+    global worker_features
+    worker_features = None
+
+def fit_path(label: str, path: List[Config], y_train: np.ndarray, y_test: np.ndarray, data: str,
+             vectorizer: str, max_iter: Optional[int], registry: Optional[str]) -> List[Tuple[str, str, float, float]]:
+    """Fits, saves, predicts and evaluates the configurations of a path, in order,
+    recording each run in the registry if any
+
+    Returns:
+        List[Tuple[str, str, float, float]]: Label, configuration, accuracy and seconds of each fit
+    """
+    (X_train, _), (X_test, _) = worker_features
+    results = []
+    clf = None
+    for config in path:
+        start = time.perf_counter()
+        if clf is None or config.kind != "logistic":
+            clf = make_classifier(config, max_iter)
+        else:
+            # keeps coef_ of the previous C as the starting point
+            clf.set_params(C=config.C)
+        clf.fit(X_train, y_train)
+        seconds = time.perf_counter() - start
+
+        model, predictions, performance = output_paths(data, label, config, vectorizer)
+        save_model(clf, model)
+        os.makedirs(os.path.dirname(predictions), exist_ok=True)
+        start = time.perf_counter()
+        y = clf.predict(X_test)
+        predict_seconds = time.perf_counter() - start
+        save_predictions(predictions, y_test, y)
+
+        # the stdout of evaluate.py, as learn.sh saves it
+        labels, conf_matrix = confusion([predictions])
+        os.makedirs(os.path.dirname(performance), exist_ok=True)
+        with open(performance, "w") as log:
+            print(report(labels, conf_matrix), file=log)
+            print(conf_matrix, file=log)
+        if registry is not None:
+            record(registry, os.path.splitext(os.path.basename(predictions))[0], labels, conf_matrix,
+                   label=label, model=config.name, vectorizer=vectorizer, predictions=predictions,
+                   fit_seconds=seconds, predict_seconds=predict_seconds)
+        accuracy = np.trace(conf_matrix) / max(conf_matrix.sum(), 1)
+        results.append((label, config.name, accuracy, seconds))
+    return results
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Fits a grid of classifiers on features vectorized once, "
+                                     "saving their models, predictions and reports as learn.sh does")
+
+    parser.add_argument("corpus", help="Directory of the blog csv corpus")
+    parser.add_argument("test", help="Directory of the test slice in the blog csv corpus")
+    parser.add_argument("vectorizer", help="Vectorizer file, ex. data/vectorizers/tfidf.vec")
+
+    parser.add_argument("--label", help="Labels to train for (default: all three)", nargs='+',
+                        default=["gender", "age", "zodiac"])
+    parser.add_argument("--model", help="Classifier kind (default: %(default)s)", choices=KINDS,
+                        default="logistic")
+    parser.add_argument("--C", help="Inverse regularization strengths, a warm-started path "
+                        "(default: %(default)s)", nargs='+', type=float, default=[20.0])
+    parser.add_argument("--solver", help="Solvers of the logistic regression, one path each "
+                        "(default: scikit-learn's)", nargs='+', default=[None])
+    parser.add_argument("--penalty", help="Penalties, one path each (default: scikit-learn's)",
+                        nargs='+', default=[None])
+    parser.add_argument("--max-iter", help="Iterations of each fit (default: scikit-learn's)", type=int)
+
+    parser.add_argument("--jobs", help="Worker processes fitting the paths (default: one per core)",
+                        type=int, default=os.cpu_count())
+    parser.add_argument("--data", help="Folder of the models, predictions and performances folders "
+                        "(default: %(default)s)", default="data")
+    parser.add_argument("--registry", help="Run registry recording the metrics, for examine.py "
+                        "(default: %(default)s)", default=DEFAULT_PATH)
+    parser.add_argument("--no-registry", help="Do not record the runs", const=True, action='store_const',
+                        default=False)
+
+    parser.add_argument("--compiled", help="Memory-map the compiled corpus instead of parsing the csv files "
+        "(compiled on first use, see corpus/cache.py)", const=True, action='store_const', default=False)
+    parser.add_argument("--feature-cache", help="Where to cache transformed corpora (default: data/features)",
+                        default=DEFAULT_DIRECTORY)
+    parser.add_argument("--cache-size", help="Size of the feature cache in MB (default: %(default)s)",
+                        type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--no-cache", help="Always transform the corpus, without the feature cache",
+                        const=True, action='store_const', default=False)
+    parser.add_argument("--vectorize-jobs", help="Worker processes transforming the corpus (default: 1)",
+                        type=int, default=1)
+
+    args = parser.parse_args()
+    if args.model == "svm" and args.solver != [None]:
+        parser.error("--solver only applies to the logistic regression")
+    return args
+
+def main():
+    args = get_args()
+    vectorizer = os.path.splitext(os.path.basename(args.vectorizer))[0]
+
+    # Vectorize once, as train.py and predict.py would
+    start = time.perf_counter()
+    X_train, training_data = load_features(args)
+    X_test, test_data = load_features(argparse.Namespace(**dict(vars(args), corpus=args.test)))
+    print("Vectorized in {:.1f}s".format(time.perf_counter() - start), file=sys.stderr)
+
+    registry = None if args.no_registry else args.registry
+    tasks = [(label, path) for label in args.label
+             for path in paths(args.model, args.C, args.solver, args.penalty)]
+    targets = {label: (np.asarray(training_data[label]), np.asarray(test_data[label]))
+               for label in args.label}
+
+    results = []
+    with SharedCSR(X_train) as shared_train, SharedCSR(X_test) as shared_test:
+        del X_train, X_test
+        if args.jobs <= 1:
+            attach_features(shared_train.spec, shared_test.spec)
+            for label, path in tasks:
+                results.extend(fit_path(label, path, *targets[label], args.data, vectorizer, args.max_iter,
+                                        registry))
+        else:
+            with ProcessPoolExecutor(max_workers=min(args.jobs, len(tasks)), initializer=attach_features,
+                                     initargs=(shared_train.spec, shared_test.spec)) as pool:
+                futures = [pool.submit(fit_path, label, path, *targets[label], args.data, vectorizer,
+                                       args.max_iter, registry)
+                           for label, path in tasks]
+                for future in futures:
+                    results.extend(future.result())
+        detach_features()
+
+    for label, name, accuracy, seconds in sorted(results, key=lambda result: (result[0], -result[2])):
+        print("{:<8} {:<30} accuracy {:.4f}  fit {:.1f}s".format(label, name, accuracy, seconds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+# The tests import the modules of the repository root, as its scripts do
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
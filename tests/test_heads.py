@@ -0,0 +1,39 @@
+# MultiHeadPredictor against the predict of each of its models
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+from heads import MultiHeadPredictor
+from train import make_classifier, make_incremental_classifier
+
+ZODIACS = ["Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio",
+           "Sagittarius", "Capricorn", "Aquarius", "Pisces"]
+
+
+def labels(rng: np.random.Generator, size: int):
+    # binary gender, three age categories, twelve signs
+    return {
+        "age": rng.choice([0, 1, 2], size),
+        "gender": rng.choice(["female", "male"], size),
+        "zodiac": rng.choice(ZODIACS, size),
+    }
+
+
+@pytest.mark.parametrize("make", [make_classifier, make_incremental_classifier])
+def test_predict(make):
+    rng = np.random.default_rng(0)
+    X = sparse_random(300, 50, density=0.2, format='csr', random_state=0)
+    y = labels(rng, X.shape[0])
+    # the labels follow the features, so that the scores are not all on one side
+    y["gender"] = np.where(X[:, 0].toarray().ravel() > X[:, 1].toarray().ravel(), "male", "female")
+    models = {label: make().set_params(random_state=0).fit(X, values) for label, values in y.items()}
+
+    predictor = MultiHeadPredictor(models)
+    # the binary head has a single score column
+    assert [stop - start for _, start, stop, _ in predictor.heads] == [3, 1, 12]
+
+    X_test = sparse_random(100, 50, density=0.2, format='csr', random_state=1)
+    predictions = predictor.predict(X_test)
+    for label, model in models.items():
+        expected = model.predict(X_test)
+        assert len(set(expected)) > 1
+        np.testing.assert_array_equal(predictions[label], expected)
@@ -0,0 +1,57 @@
+# Parity of FastTweetTokenizer with nltk's TweetTokenizer on edge cases
+import pytest
+from nltk.tokenize import TweetTokenizer
+from corpus.tokenizer import CONFIGURATIONS, FastTweetTokenizer
+
+TEXTS = [
+    "",
+    "   ",
+    "plain words only",
+    # phone numbers, spanning whitespace
+    "call me at 555 123 4567 tonight",
+    "(514) 343-6111 or +1 514 343 6111",
+    "numbers 12 34 5678 and 1 800 555 1234",
+    # ellipses, spaced or not
+    "wait. . . what",
+    "so... anyway . . . done.",
+    "end . .",
+    # emoticons and their case
+    ":) :-) :P :-D D: XD <3 </3 ;)",
+    "LOL :P XD :D and LOUD",
+    # lengthening
+    "soooooo cooooool!!!!!! yessss",
+    "hahahahaha ?!?!?!?! ......",
+    # whitespace runs of every kind
+    "a   b\t\tc\n\nd \r\n e f",
+    "  leading and trailing  ",
+    # html entities, handles, hashtags, urls
+    "&amp; &lt;3 &#39;quoted&#39; &quot;",
+    "@user_1 and @Someone_Else said #WOW",
+    "see http://example.com/a?b=c&d=e and www.example.org.",
+    # non ascii, emoji sequences
+    "café NAÏVE Ünïcödé straße",
+    "👍🏽 nice 👨‍👩‍👧 family \x1cend",
+    # numbers, contractions, punctuation
+    "1,000.50 3.14 -42 don't won't y'all",
+    "end-of-line--dashes and/or slashes",
+]
+
+
+@pytest.mark.parametrize("name", sorted(CONFIGURATIONS))
+def test_parity(name):
+    settings = CONFIGURATIONS[name]
+    reference = TweetTokenizer(**settings)
+    fast = FastTweetTokenizer(**settings)
+    for text in TEXTS:
+        assert fast.tokenize(text) == reference.tokenize(text), text
+    # again, from the memoized chunks
+    for text in TEXTS:
+        assert fast.tokenize(text) == reference.tokenize(text), text
+
+
+@pytest.mark.parametrize("name", sorted(CONFIGURATIONS))
+def test_parity_joined(name):
+    # tokens spanning whitespace next to ordinary chunks
+    settings = CONFIGURATIONS[name]
+    text = " ".join(TEXTS)
+    assert FastTweetTokenizer(**settings).tokenize(text) == TweetTokenizer(**settings).tokenize(text)
@@ -1,63 +1,197 @@
 # Train using vectorizers saved on disk
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pickle import dump, load
-import pandas as pd
-from pandas.core.frame import DataFrame
+import sys
+from typing import Dict, List
+import numpy as np
+from loader import load_corpus
+import parallel
+from compact import load_vectorizer
+from features import DEFAULT_DIRECTORY, DEFAULT_SIZE, FeatureCache, cache_key, load_token_store
+from shared import SharedCSR, attach
+from corpus.preprocessing import Labels, LabelStore, Preprocessor
 
 def get_args():
     parser = argparse.ArgumentParser(description="Trains a model and saves it to disk")
 
     parser.add_argument("corpus", help="Directory of the blog csv corpus")
     parser.add_argument("vectorizer", help="Vectorizer file")
-    parser.add_argument("save", help="Save location for the model")
+    parser.add_argument("save", help="Save location for the model. "
+        "With several labels, '{label}' is replaced by each label, ex. data/models/{label}-logistic-tfidf.model")
 
-    parser.add_argument("--label", help="Which label to train for, ex. 'gender' (default), 'age', 'zodiac'",\
-        default="gender")
+    parser.add_argument("--label", help="Which labels to train for, ex. 'gender' (default), 'age', 'zodiac'. "
+        "Several labels are trained in parallel on the same features", nargs='+', default=["gender"])
+    parser.add_argument("--jobs", help="Worker processes when training several labels (default: one per label)",\
+        type=int)
 
-    return parser.parse_args()
+    parser.add_argument("--compiled", help="Memory-map the compiled corpus instead of parsing the csv files "
+        "(compiled on first use, see corpus/cache.py)", const=True, action='store_const', default=False)
 
-def main():
-    args = get_args()
-
-    # Load vectorizer
-    vectorizer = load(open(args.vectorizer, 'rb'))
+    parser.add_argument("--feature-cache", help="Where to cache transformed corpora (default: data/features)",\
+        default=DEFAULT_DIRECTORY)
+    parser.add_argument("--cache-size", help="Size of the feature cache in MB (default: %(default)s)",\
+        type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--no-cache", help="Always transform the corpus, without the feature cache",\
+        const=True, action='store_const', default=False)
+    parser.add_argument("--vectorize-jobs", help="Worker processes transforming the corpus (default: 1)",\
+        type=int, default=1)
+    parser.add_argument("--tokens", help="The corpus is a token store (corpus/preprocessing.py --tokens): "
+        "build the features from its token IDs without tokenizing", const=True, action='store_const', default=False)
 
-    # Get corpus
-    def categorize(age: str) -> int:
-        if int(age) <= 19:
-            return 0
-        elif int(age) <= 29:
-            return 1
-        else:
-            return 2
-    training_data : DataFrame = None
-    for csv_file in os.listdir(args.corpus):
-        with open(os.path.join(args.corpus, csv_file), encoding='utf-8') as file:
-            data = pd.read_csv(file, names=['bloggerID', 'gender', 'age', 'zodiac', 'blog'])
-            if training_data is None:
-                training_data = data
-            else:
-                training_data = training_data.append(data)
-    training_data['age'] = training_data['age'].apply(categorize)
+    parser.add_argument("--stream", help="Train out of core: stream the corpus in batches through a hashing "
+        "vectorizer (vectorizer.py --hashing) into incremental classifiers. Memory use does not grow "
+        "with the corpus", const=True, action='store_const', default=False)
+    parser.add_argument("--batch-size", help="Blogs per batch with --stream (default: %(default)s)",\
+        type=int, default=1000)
 
-    # Apply corpus
-    X_train = vectorizer.transform(training_data['blog'])
+    args = parser.parse_args()
+    if len(args.label) > 1 and "{label}" not in args.save:
+        parser.error("the save location needs a '{label}' placeholder when training several labels")
+    return args
 
+def make_classifier():
     # EDIT HERE
     # Train classifier
     from sklearn.linear_model import LogisticRegression
-    clf = LogisticRegression(C=20, n_jobs=-1, multi_class='ovr')
+    return LogisticRegression(C=20, n_jobs=-1, multi_class='ovr')
 
-    clf.fit(X_train, training_data[args.label])
+def make_incremental_classifier():
+    # EDIT HERE
+    # Classifier of --stream, must support partial_fit
+    from sklearn.linear_model import SGDClassifier
+    return SGDClassifier(loss='log_loss', alpha=1e-6)
 
+def save_model(clf, save: str):
     # Save classifier on disk
-    save_folder, _ = os.path.split(args.save)
+    save_folder, _ = os.path.split(save)
     os.makedirs(save_folder, exist_ok=True)
 
-    with open(args.save, "wb") as model:
+    with open(save, "wb") as model:
         dump(clf, model)
 
+# Features of the worker processes, attached from shared memory
+worker_features = None
+
+def attach_features(spec):
+    global worker_features
+    worker_features = attach(spec)
+
+def fit_and_save(y, save: str) -> str:
+    X_train, _ = worker_features
+    # one process per label already, threads would compete for the same cores
+    clf = make_classifier().set_params(n_jobs=1)
+    clf.fit(X_train, y)
+    save_model(clf, save)
+    return save
+
+def corpus_classes(corpus: str, labels: List[str]) -> Dict[str, List]:
+    """Finds every class of the labels from the names of the csv files,
+    as partial_fit needs them all from the first batch
+    """
+    classes: Dict[str, set] = {label: set() for label in labels}
+    for csv_file in os.listdir(corpus):
+        if not csv_file.endswith(".csv"):
+            continue
+        id, gender, age, zodiac, _ = csv_file.split('.')
+        blogger = Labels(id, gender, age, zodiac)
+        for label in labels:
+            classes[label].add(getattr(blogger, label))
+    return {label: sorted(values) for label, values in classes.items()}
+
+def passthrough(tokens: List[str]) -> List[str]:
+    return tokens
+
+def train_stream(args):
+    """Trains one incremental classifier per label, batch by batch
+    """
+    from sklearn.base import clone
+    from sklearn.feature_extraction.text import HashingVectorizer
+    vectorizer = load(open(args.vectorizer, 'rb'))
+    # a fitted vocabulary would be lost by the clone below
+    if not isinstance(vectorizer, HashingVectorizer):
+        raise SystemExit("--stream needs a hashing vectorizer (vectorizer.py --hashing), {} is a {}"
+                         .format(args.vectorizer, type(vectorizer).__name__))
+
+    # the preprocessor tokenizes exactly like the saved vectorizer,
+    # whose twin then only hashes the tokens
+    preprocessor = Preprocessor(args.corpus)
+    preprocessor.compiled = args.compiled
+    preprocessor.tokenizer = vectorizer.build_analyzer()
+    hasher = clone(vectorizer).set_params(analyzer=passthrough)
+
+    classes = corpus_classes(args.corpus, args.label)
+    models = {label: make_incremental_classifier() for label in args.label}
+
+    trained = 0
+    for batch in preprocessor.run_yield_slice(args.batch_size):
+        # only the labels of the batch, so that memory does not grow with the corpus
+        batch_labels = LabelStore(len(batch))
+        for _, blogger in batch:
+            batch_labels.append(blogger)
+        X_batch = hasher.transform([tokens for tokens, _ in batch])
+        for label, clf in models.items():
+            clf.partial_fit(X_batch, batch_labels[label], classes=classes[label])
+        trained += len(batch)
+        print("Trained on {} blogs".format(trained), end='\r', file=sys.stderr)
+    print(file=sys.stderr)
+
+    for label, clf in models.items():
+        save = args.save.replace("{label}", label)
+        save_model(clf, save)
+        print("Saved {}".format(save))
+
+def load_features(args):
+    """Features and labels of the csv corpus, reusing the feature cache when possible
+    """
+    # Reuse the transformed corpus of a previous run, if any
+    cache = None if args.no_cache else FeatureCache(args.feature_cache, args.cache_size)
+    # the key hashes the vectorizer file, only worth it with a cache
+    key = None if cache is None else cache_key(args.vectorizer, args.corpus)
+    X_train = None if cache is None else cache.load(key)
+
+    # Get corpus
+    columns = ['blog'] + args.label if X_train is None else args.label
+    training_data = load_corpus(args.corpus, columns=columns, compiled=args.compiled)
+
+    # Apply corpus
+    if X_train is None:
+        vectorizer = load_vectorizer(args.vectorizer)
+        X_train = parallel.transform(vectorizer, training_data['blog'], args.vectorize_jobs)
+        if cache is not None:
+            cache.save(key, X_train)
+    return X_train, training_data
+
+def main():
+    args = get_args()
+
+    if args.stream:
+        train_stream(args)
+        return
+
+    if args.tokens:
+        X_train, training_data = load_token_store(args.corpus, args.vectorizer)
+    else:
+        X_train, training_data = load_features(args)
+
+    if len(args.label) == 1:
+        clf = make_classifier()
+        clf.fit(X_train, training_data[args.label[0]])
+        save_model(clf, args.save.replace("{label}", args.label[0]))
+        return
+
+    # One model per label, fitted in parallel on the same shared features
+    with SharedCSR(X_train) as shared:
+        del X_train
+        with ProcessPoolExecutor(max_workers=args.jobs or len(args.label),
+                initializer=attach_features, initargs=(shared.spec,)) as pool:
+            futures = [pool.submit(fit_and_save, np.asarray(training_data[label]),
+                                   args.save.replace("{label}", label))
+                       for label in args.label]
+            for future in futures:
+                print("Saved {}".format(future.result()))
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,8 +3,10 @@
 import argparse
 import os
 from pickle import dump
-import pandas as pd
-from pandas.core.frame import DataFrame
+from loader import load_corpus
+import parallel
+from features import fit_tokens
+from corpus.token_store import TokenStore
 
 def get_args():
     parser = argparse.ArgumentParser(description="Trains a vectorizer and saves it to disk")
@@ -12,29 +14,52 @@ def get_args():
     parser.add_argument("corpus", help="Directory of the blog csv corpus")
     parser.add_argument("save", help="Save location for the vectorizer")
 
+    parser.add_argument("--compiled", help="Memory-map the compiled corpus instead of parsing the csv files "
+        "(compiled on first use, see corpus/cache.py)", const=True, action='store_const', default=False)
+
+    parser.add_argument("--jobs", help="Worker processes tokenizing the corpus (default: 1)", type=int, default=1)
+
+    parser.add_argument("--hashing", help="Save a stateless hashing vectorizer, for train.py --stream. "
+        "The corpus is not read", const=True, action='store_const', default=False)
+    parser.add_argument("--features", help="Number of hashed features (default: 2**20)", type=int, default=2 ** 20)
+
+    parser.add_argument("--tokens", help="The corpus is a token store (corpus/preprocessing.py --tokens): "
+        "fit on its token IDs without tokenizing", const=True, action='store_const', default=False)
+
+    parser.add_argument("--compact", help="Also export the memory-mapped format (see compact.py), "
+        "which loads much faster; a hashing vectorizer has none", const=True, action='store_const', default=False)
+
     return parser.parse_args()
 
 def main():
     args = get_args()
 
-    # Get corpus
-    training_data : DataFrame = None
-    for csv_file in os.listdir(args.corpus):
-        with open(os.path.join(args.corpus, csv_file), encoding='utf-8') as file:
-            data = pd.read_csv(file, names=['bloggerID', 'gender', 'age', 'zodiac', 'blog'])
-            if training_data is None:
-                training_data = data
-            else:
-                training_data = training_data.append(data)
-
     # EDIT HERE
     # Fit vectorizer, put preprocessing
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from nltk.tokenize import TweetTokenizer
-    tweet = TweetTokenizer()
-    vectorizer = TfidfVectorizer(tokenizer=tweet.tokenize, lowercase=False)
+    # same tokens as nltk's TweetTokenizer, only faster
+    from corpus.tokenizer import FastTweetTokenizer
+    tweet = FastTweetTokenizer()
+
+    if args.hashing:
+        # stateless, nothing to fit
+        from sklearn.feature_extraction.text import HashingVectorizer
+        vectorizer = HashingVectorizer(tokenizer=tweet.tokenize, lowercase=False,\
+            n_features=args.features, alternate_sign=False)
+    elif args.tokens:
+        # raw texts, ex. in quiz.py, go through the preprocessing that made the token store
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from corpus.preprocessing import project_preprocessor
+        vectorizer = TfidfVectorizer(tokenizer=project_preprocessor(args.corpus).preprocess, lowercase=False)
+
+        fit_tokens(vectorizer, TokenStore(args.corpus))
+    else:
+        # Get corpus
+        training_data = load_corpus(args.corpus, columns=['blog'], compiled=args.compiled)
 
-    vectorizer.fit(training_data['blog'])
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        vectorizer = TfidfVectorizer(tokenizer=tweet.tokenize, lowercase=False)
+
+        parallel.fit(vectorizer, training_data['blog'], args.jobs)
 
     # Save vectorizer
     save_folder, _ = os.path.split(args.save)
@@ -42,6 +67,11 @@ def main():
 
     with open(args.save, "wb") as model:
         dump(vectorizer, model)
+
+    # written after the pickle, so that load_vectorizer sees it up to date
+    if args.compact and not args.hashing:
+        from compact import compact_path, export_vectorizer
+        export_vectorizer(vectorizer, compact_path(args.save))
         
 if __name__ == "__main__":
     main()
\ No newline at end of file